@@ -0,0 +1,219 @@
+# Physical supports tracked next to the fluents: a block number, the table or the hand.
+TABLE, HAND = 0, -1
+
+# Fluents of the Blocks World and their number of block arguments. stacked(i, j) is
+# only partially known: pairs never constrained are left open, like the uninterpreted
+# function of the Z3 encoding.
+FLUENTS = {"table": 1, "hand": 1, "clear": 1, "stacked": 2, "handsfree": 0}
+
+class Literal:
+    # fluent(args) == value, with args naming parameters of the action.
+    __slots__ = ("fluent", "args", "value")
+
+    def __init__(self, fluent, args=(), value=True):
+        if fluent not in FLUENTS or len(args) != FLUENTS[fluent]:
+            raise ValueError(f"unknown fluent {fluent}{tuple(args)}")
+        self.fluent = fluent
+        self.args = tuple(args)
+        self.value = value
+
+def holds(fluent, *args):
+    return Literal(fluent, args, True)
+
+def fails(fluent, *args):
+    return Literal(fluent, args, False)
+
+class ActionSchema:
+    # STRIPS-style action: preconditions on the current state and effects on the next
+    # one, both in the order they are encoded and reported. support says where the
+    # moved block ends up: (block parameter, parameter or "table"/"hand"). advice is the
+    # explanation added to the feedback when the action fails, formatted with the
+    # parameters by name.
+    def __init__(self, name, params, preconditions, effects, support=None, advice=None):
+        self.name = name
+        self.params = tuple(params)
+        self.preconditions = list(preconditions)
+        self.effects = list(effects)
+        self.support = support
+        self.advice = advice
+
+# Explanation appended to the feedback of a failed step, with the parameters of the
+# action filled in.
+UNSTACK_ADVICE = """
+    **Why is this incorrect?**
+    - `{x}` **is not stacked on `{y}`**.
+    - `unstack(x, y)` requires that:
+      1. `x` must be **clear** (no block on top).
+      2. `x` must **not be on the table** (i.e., it should be stacked on `y`).
+      3. The robot's hand must be **empty** before unstacking.
+
+    **How to fix this?**
+    - Ensure that `{x}` is actually stacked on `{y}` before attempting `unstack({x}, {y})`.
+    - If `{x}` is already on the table, use `pick-up({x})` instead.
+
+    **Example Correction**
+    ```plaintext
+    # If `{x}` is on the table, do this instead:
+    pick-up({x})  
+
+    # If `{x}` is not clear, first remove its top block:
+    unstack(top_block, {x})  
+    ```
+    """
+
+STACK_ADVICE = """
+    **Why is this incorrect?**
+    - `{x}` **cannot be stacked on `{y}`** because:
+      1. `{y}` is **not clear**.
+      2. `{x}` is **not in the robot's hand**.
+    
+    **How to fix this?**
+    - If `{y}` is not clear, first remove any block stacked on it.
+    - Ensure that `{x}` is picked up before attempting to stack it.
+
+    **Example Correction**
+    ```plaintext
+    # If `{y}` is not clear:
+    unstack(top_block, {y})
+
+    # If `{x}` is not in hand:
+    pick-up({x})
+    stack({x}, {y})
+    ```
+    """
+
+PICK_UP_ADVICE = """
+    **Why is this incorrect?**
+    - The block `{x}` is **not clear or not on the table**.
+    - `pick-up(i)` requires that:
+      1. `{x}` is **clear** (no blocks on top of it).
+      2. `{x}` is **directly on the table**.
+
+    **How to fix this?**
+    - If `{x}` is **not clear**, first remove any block stacked on it.
+    - If `{x}` is **not on the table**, you must `unstack({x}, X)` first, then `put-down({x})`.
+
+    **Example Correction**
+    ```plaintext
+    unstack({x}, X)  # First, remove it from another block
+    put-down({x})     # Place it on the table
+    pick-up({x})      # Now, it is clear and on the table
+    ```
+    """
+
+PUT_DOWN_ADVICE = """
+    **Why is this incorrect?**
+    - `{x}` **cannot be put down** because:
+      1. The robot **is not holding `{x}`**.
+      2. `{x}` **is not picked up yet**.
+    
+    **How to fix this?**
+    - Ensure that `{x}` is in hand before using `put-down({x})`.
+
+    **Example Correction**
+    ```plaintext
+    pick-up({x})  
+    put-down({x})  
+    ```
+    """
+
+BLOCKS_WORLD = [
+    ActionSchema("unstack", ("x", "y"),
+                 [holds("clear", "x"), fails("table", "x"), holds("stacked", "x", "y"), holds("handsfree")],
+                 [holds("hand", "x"), fails("stacked", "x", "y"), fails("handsfree"), holds("clear", "y"), fails("clear", "x")],
+                 support=("x", "hand"),
+                 advice=UNSTACK_ADVICE),
+    ActionSchema("stack", ("x", "y"),
+                 [holds("hand", "x"), fails("handsfree"), holds("clear", "y")],
+                 [holds("stacked", "x", "y"), fails("hand", "x"), holds("handsfree"), fails("clear", "y"), holds("clear", "x")],
+                 support=("x", "y"),
+                 advice=STACK_ADVICE),
+    ActionSchema("pick-up", ("x",),
+                 [holds("table", "x"), holds("handsfree"), holds("clear", "x")],
+                 [holds("hand", "x"), fails("handsfree"), fails("table", "x")],
+                 support=("x", "hand"),
+                 advice=PICK_UP_ADVICE),
+    ActionSchema("put-down", ("x",),
+                 [holds("hand", "x"), fails("handsfree")],
+                 [holds("table", "x"), fails("hand", "x"), holds("handsfree"), holds("clear", "x")],
+                 support=("x", "table"),
+                 advice=PUT_DOWN_ADVICE),
+]
+
+def fact(kind, blocks):
+    # ("not_table", (3,)) -> "not table(3)"
+    negated = kind.startswith("not_")
+    text = kind[len("not_"):] if negated else kind
+    if blocks:
+        text += f"({', '.join(map(str, blocks))})"
+    return f"not {text}" if negated else text
+
+class Condition:
+    # A literal compiled for one action: its argument positions, its unsat-core label
+    # prefix and the kind recorded in the label table.
+    __slots__ = ("fluent", "positions", "value", "phase", "kind", "prefix")
+
+    def __init__(self, schema, literal, phase):
+        self.fluent = literal.fluent
+        self.positions = tuple(schema.params.index(arg) for arg in literal.args)
+        self.value = literal.value
+        self.phase = phase
+        self.kind = literal.fluent if literal.value else f"not_{literal.fluent}"
+        self.prefix = f"{phase}_{schema.name.replace('-', '')}_{self.kind}_step_"
+
+    def blocks(self, params):
+        return tuple(params[k] for k in self.positions)
+
+    def label(self, step, blocks):
+        if blocks:
+            return f"{self.prefix}{step}_block_{'_'.join(map(str, blocks))}"
+        return f"{self.prefix}{step}"
+
+class ActionTemplate:
+    # An ActionSchema compiled once: everything that does not depend on the blocks of
+    # a step is resolved here, so a step only binds its parameters.
+    def __init__(self, schema):
+        self.name = schema.name
+        self.params = schema.params
+        self.arity = len(schema.params)
+        self.advice = schema.advice
+        self.preconditions = [Condition(schema, literal, "pre") for literal in schema.preconditions]
+        self.effects = [Condition(schema, literal, "post") for literal in schema.effects]
+        self.conditions = self.preconditions + self.effects
+
+        # Effects that make the same fluent true and false are contradictory when their
+        # arguments coincide, e.g. unstack(x, x); the true one is reported.
+        self.conflicts = [(add, delete) for add in self.effects for delete in self.effects
+                          if add.fluent == delete.fluent and add.value and not delete.value]
+
+        # (position of the moved block, position of its new support or None, constant support)
+        self.support = None
+        if schema.support is not None:
+            block, target = schema.support
+            if target in ("table", "hand"):
+                self.support = (schema.params.index(block), None, TABLE if target == "table" else HAND)
+            else:
+                self.support = (schema.params.index(block), schema.params.index(target), None)
+
+    def affected(self, params):
+        # Fluent instances written by the action, the exceptions to the frame axioms.
+        affected = {}
+        for effect in self.effects:
+            blocks = effect.blocks(params)
+            if not blocks:
+                affected[effect.fluent] = True
+            else:
+                affected.setdefault(effect.fluent, []).append(blocks[0] if len(blocks) == 1 else blocks)
+        return affected
+
+    def support_of(self, params):
+        # (block, new support) of the moved block, or None.
+        if self.support is None:
+            return None
+        block, target, constant = self.support
+        return params[block], constant if target is None else params[target]
+
+def compile_actions(schemas):
+    return {schema.name: ActionTemplate(schema) for schema in schemas}
+
+ACTIONS = compile_actions(BLOCKS_WORLD)
@@ -0,0 +1,182 @@
+import numpy as np
+
+from ActionSchema import ACTIONS, FLUENTS, TABLE
+
+
+# Same rules as simulate_action, applied to the i-th action of many candidate plans at
+# once. Candidates are rows, blocks are columns (column 0 is unused, like in
+# ConcreteState).
+TEMPLATES = list(ACTIONS.values())
+ACTION_KINDS = {template.name: kind for kind, template in enumerate(TEMPLATES, start=1)}
+MAX_ARITY = max(template.arity for template in TEMPLATES)
+# An action simulate_action can not decide (unknown name, bad or out of range blocks).
+UNDECIDED = -1
+
+class BatchState:
+    __slots__ = ("count", "num_blocks", "table", "hand", "clear", "stacked", "handsfree", "on")
+
+    def __init__(self, initial_state, count):
+        # count copies of a ConcreteState.
+        self.count = count
+        self.num_blocks = initial_state.num_blocks
+        self.table = np.tile(np.array(initial_state.table, dtype=bool), (count, 1))
+        self.hand = np.tile(np.array(initial_state.hand, dtype=bool), (count, 1))
+        self.clear = np.tile(np.array(initial_state.clear, dtype=bool), (count, 1))
+        self.handsfree = np.full(count, initial_state.handsfree, dtype=bool)
+        self.on = np.tile(np.array(initial_state.on, dtype=np.int32), (count, 1))
+        # stacked(i, j) is only partially known, so the pairs known to be true and the
+        # pairs known to be false are kept as two bit matrices [count, blocks, bytes].
+        shape = (count, self.num_blocks + 1, self.num_blocks // 8 + 1)
+        self.stacked = {True: np.zeros(shape, dtype=np.uint8), False: np.zeros(shape, dtype=np.uint8)}
+        for (i, j), value in initial_state.stacked.items():
+            self.stacked[value][:, i, j >> 3] |= np.uint8(1 << (j & 7))
+
+    def violates(self, rows, fluent, blocks, value):
+        # Rows where fluent(blocks) is known and differs from value.
+        if FLUENTS[fluent] == 0:
+            return getattr(self, fluent)[rows] != value
+        if FLUENTS[fluent] == 1:
+            return getattr(self, fluent)[rows, blocks[0]] != value
+        i, j = blocks
+        bits = self.stacked[not value][rows, i, j >> 3]
+        return (bits >> (j & 7).astype(np.uint8)) & 1 == 1
+
+    def assign(self, rows, fluent, blocks, value):
+        if FLUENTS[fluent] == 0:
+            getattr(self, fluent)[rows] = value
+        elif FLUENTS[fluent] == 1:
+            getattr(self, fluent)[rows, blocks[0]] = value
+        else:
+            i, j = blocks
+            bits = np.uint8(1) << (j & 7).astype(np.uint8)
+            self.stacked[value][rows, i, j >> 3] |= bits
+            self.stacked[not value][rows, i, j >> 3] &= ~bits
+
+def encode_action(action_tuple, num_blocks):
+
+    action, *params = action_tuple
+    kind = ACTION_KINDS.get(action, UNDECIDED)
+    try:
+        params = list(map(int, params))
+    except ValueError:
+        return (UNDECIDED,) + (0,) * MAX_ARITY
+    if kind == UNDECIDED or len(params) != TEMPLATES[kind - 1].arity or any(p < 1 or p > num_blocks for p in params):
+        return (UNDECIDED,) + (0,) * MAX_ARITY
+    return (kind, *params) + (0,) * (MAX_ARITY - len(params))
+
+def encode_plans(plans, num_blocks):
+
+    # Action lists as returned by parse_plan to a [candidates, steps] array of action
+    # kinds and a [candidates, steps, parameters] array of blocks, padded with 0 after
+    # the end of every plan. Candidates mostly repeat the same actions, so each
+    # distinct action is encoded once.
+    codes = {}
+    flat = []
+    for actions in plans:
+        for action in actions:
+            code = codes.get(action)
+            if code is None:
+                code = codes[action] = encode_action(action, num_blocks)
+            flat.append(code)
+
+    lengths = np.array([len(actions) for actions in plans], dtype=np.int32)
+    steps = int(lengths.max()) if len(plans) else 0
+    rows = np.repeat(np.arange(len(plans)), lengths)
+    columns = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    flat = np.array(flat, dtype=np.int32).reshape(-1, 1 + MAX_ARITY)
+
+    kinds = np.zeros((len(plans), steps), dtype=np.int8)
+    kinds[rows, columns] = flat[:, 0]
+    blocks = np.zeros((len(plans), steps, MAX_ARITY), dtype=np.int32)
+    blocks[rows, columns] = flat[:, 1:]
+    return kinds, blocks, lengths
+
+def simulate_batch(state, kinds, blocks, lengths):
+
+    # Applies the plans step by step and returns, per candidate, the first failing step
+    # (0 if every action applies) and whether that step could be decided without the
+    # solver. Like simulate_action, a failing action leaves its candidate untouched.
+    failed = np.zeros(state.count, dtype=np.int32)
+    decided = np.ones(state.count, dtype=bool)
+
+    for column in range(kinds.shape[1]):
+        step = column + 1
+        active = (failed == 0) & (column < lengths)
+        kind = kinds[:, column]
+
+        rows = np.nonzero(active & (kind == UNDECIDED))[0]
+        failed[rows] = step
+        decided[rows] = False
+
+        for code, template in enumerate(TEMPLATES, start=1):
+            rows = np.nonzero(active & (kind == code))[0]
+            if not len(rows):
+                continue
+            params = blocks[rows, column].T
+
+            bad = np.zeros(len(rows), dtype=bool)
+            for condition in template.preconditions:
+                bad |= state.violates(rows, condition.fluent, condition.blocks(params), condition.value)
+            for add, delete in template.conflicts:
+                bad |= np.logical_and.reduce([a == d for a, d in zip(add.blocks(params), delete.blocks(params))])
+            failed[rows[bad]] = step
+
+            rows, params = rows[~bad], params[:, ~bad]
+            for effect in template.effects:
+                state.assign(rows, effect.fluent, effect.blocks(params), effect.value)
+            support = template.support_of(params)
+            if support is not None:
+                state.on[rows, support[0]] = support[1]
+
+    return failed, decided
+
+def goal_distances(state, goal_state):
+
+    # goal_distance for every candidate: a block is in place if it sits on its goal
+    # support and that support is in place, down to the table. Iterated to a fixed
+    # point, at most one pass per tower level; blocks in cycles stay out of place.
+    goal_on = np.array(goal_state.on, dtype=np.int32)
+    matches = state.on == goal_on
+    matches[:, 0] = True
+    below = np.maximum(goal_on, 0)
+    in_place = matches & (goal_on == TABLE)
+    in_place[:, 0] = True
+    while True:
+        updated = matches & in_place[:, below]
+        if np.array_equal(updated, in_place):
+            break
+        in_place = updated
+    return state.num_blocks - in_place[:, 1:].sum(axis=1)
+
+def goal_matches(state, goal_state):
+
+    # compare_concrete_states(...) == [] for every candidate.
+    same = np.ones(state.count, dtype=bool)
+    for name in ("table", "hand", "clear", "on"):
+        goal = np.array(getattr(goal_state, name))
+        same &= (getattr(state, name)[:, 1:] == goal[1:]).all(axis=1)
+    return same & (state.handsfree == goal_state.handsfree)
+
+def validate_batch(initial_state, goal_state, plans, chunk_bytes=64 << 20):
+
+    # Validates parsed plans against one scenario given as ConcreteStates. Returns per
+    # candidate arrays: the first failing step (0 if every action applies), the goal
+    # distance of the state reached before it, whether it solves the goal and whether
+    # the failing step was decided (False means the plan needs the solver engines).
+    # Candidates are processed in chunks so the pair bits stay within chunk_bytes.
+    num_blocks = initial_state.num_blocks
+    chunk = max(1, chunk_bytes // (2 * (num_blocks + 1) * (num_blocks // 8 + 1) + 8 * (num_blocks + 1)))
+
+    results = []
+    for start in range(0, len(plans), chunk):
+        part = plans[start:start + chunk]
+        state = BatchState(initial_state, len(part))
+        failed, decided = simulate_batch(state, *encode_plans(part, num_blocks))
+        distances = goal_distances(state, goal_state)
+        solved = (failed == 0) & goal_matches(state, goal_state)
+        results.append((failed, distances, solved, decided))
+
+    if not results:
+        empty = np.zeros(0, dtype=np.int32)
+        return empty, empty, empty.astype(bool), empty.astype(bool)
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
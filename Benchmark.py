@@ -0,0 +1,214 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from z3 import Solver, get_version_string
+
+from DefineState import define_state_from_positions, define_finite_state
+from ConcreteState import define_concrete_state, simulate_action, compare_concrete_states
+from CheckConstrains import apply_action, apply_action_finite, run_plan
+from BatchState import validate_batch
+from Planner import generate_plan, perturb_plan, plan_text
+from ScenarioGenerator import random_scenario, adversarial_scenario, write_positions, ADVERSARIAL_KINDS
+from MockLLMServer import MockLLMServer
+
+
+DEFAULT_SIZES = [5, 10, 20, 50, 100, 200, 500, 1000]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(function, *args, repeat=1, memory=True):
+
+    # Best wall time over `repeat` runs with stdout silenced, then one separate run under
+    # tracemalloc for the peak Python heap (allocations inside Z3 are not traced).
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, best, peak
+
+def define_initial_state(initial_positions):
+    solver = Solver()
+    define_state_from_positions(solver, initial_positions, "s0")
+    return len(solver.assertions())
+
+def encode_plan(apply, initial_state, actions, *extra):
+
+    solver = Solver()
+    current_state = initial_state(solver)
+    for step, action in enumerate(actions, start=1):
+        current_state = apply(current_state, action, solver, step, *extra, [])
+        if current_state is None:
+            break
+    return len(solver.assertions())
+
+def simulate_plan(initial_state, goal_state, actions):
+
+    current_state = initial_state.copy()
+    for step, action in enumerate(actions, start=1):
+        if simulate_action(current_state, action, step):
+            return False
+    return not compare_concrete_states(current_state, goal_state)
+
+def benchmark_scenario(name, initial_positions, goal_positions, rng, args, workdir):
+
+    records = []
+    num_blocks = len(set(sum(initial_positions, [])))
+    blocks_file = os.path.join(workdir, f"{name}_{num_blocks}_initial.txt")
+    goal_file = os.path.join(workdir, f"{name}_{num_blocks}_goal.txt")
+    write_positions(blocks_file, initial_positions)
+    write_positions(goal_file, goal_positions)
+
+    valid_actions = generate_plan(initial_positions, goal_positions)
+    broken_actions = perturb_plan(valid_actions, rng, edits=1)
+    plans = {"valid": valid_actions, "broken": broken_actions}
+
+    def record(benchmark, seconds, peak, **fields):
+        records.append({"benchmark": benchmark, "scenario": name, "blocks": num_blocks, "seconds": seconds, "peak_bytes": peak, **fields})
+        details = ", ".join(f"{key}={value}" for key, value in fields.items())
+        print(f"{benchmark:<14} {name:<10} n={num_blocks:<5} {seconds * 1000:10.2f} ms  {details}")
+
+    assertions, seconds, peak = measure(define_initial_state, initial_positions, repeat=args.repeat, memory=args.memory)
+    record("define_state", seconds, peak, assertions=assertions)
+
+    initial_state = define_concrete_state(initial_positions)
+    goal_state = define_concrete_state(goal_positions)
+
+    encodings = [("finite", args.max_finite_blocks), ("function", args.max_z3_blocks)]
+    for encoding, max_blocks in encodings:
+        if num_blocks > max_blocks:
+            continue
+        if encoding == "finite":
+            encode = lambda: encode_plan(apply_action_finite, lambda solver: define_finite_state(initial_state, "s0"), valid_actions)
+        else:
+            encode = lambda: encode_plan(apply_action, lambda solver: define_state_from_positions(solver, initial_positions, "s0")[0], valid_actions, num_blocks)
+        assertions, seconds, peak = measure(encode, repeat=args.repeat, memory=args.memory)
+        record("apply_action", seconds / max(len(valid_actions), 1), peak, encoding=encoding, steps=len(valid_actions), assertions=assertions)
+
+    for kind, actions in plans.items():
+        verdict, seconds, peak = measure(simulate_plan, initial_state, goal_state, actions, repeat=args.repeat, memory=args.memory)
+        record("simulate", seconds, peak, plan=kind, steps=len(actions), verdict=verdict)
+
+        text = plan_text(actions)
+        engines = [("concrete", "finite", args.max_finite_blocks), ("z3", "finite", args.max_finite_blocks), ("z3", "function", args.max_z3_blocks)]
+        for engine, encoding, max_blocks in engines:
+            if num_blocks > max_blocks:
+                continue
+            result, seconds, peak = measure(run_plan, text, blocks_file, goal_file, engine, True, encoding, repeat=args.repeat, memory=args.memory)
+            record("run_plan", seconds, peak, engine=engine, encoding=encoding, plan=kind, steps=len(actions), verdict=result[0])
+
+    # Many perturbed candidates of the same scenario through the vectorized engine.
+    if args.batch_candidates:
+        candidates = [perturb_plan(valid_actions, rng, edits=rng.randint(0, 2)) for _ in range(args.batch_candidates)]
+        (failed, _, solved, _), seconds, peak = measure(validate_batch, initial_state, goal_state, candidates, repeat=args.repeat, memory=args.memory)
+        steps = sum(len(actions) for actions in candidates)
+        record("validate_batch", seconds, peak, candidates=len(candidates), steps=steps,
+               actions_per_second=round(steps / seconds), solved=int(solved.sum()), failed=int((failed > 0).sum()))
+
+    final_state = initial_state.copy()
+    for step, action in enumerate(valid_actions, start=1):
+        simulate_action(final_state, action, step)
+    mismatches, seconds, peak = measure(compare_concrete_states, final_state, goal_state, repeat=args.repeat, memory=args.memory)
+    record("goal_check", seconds, peak, mismatches=len(mismatches))
+
+    return records
+
+def benchmark_cegis(name, initial_positions, goal_positions, args, workdir):
+
+    # Full iterative_planning loop against a local mock LLM returning perturbed plans.
+    # Local repair is off by default, so the rounds measure the LLM loop itself.
+    import One_LLM_CEGIS
+
+    num_blocks = len(set(sum(initial_positions, [])))
+    blocks_file = os.path.join(workdir, f"cegis_{name}_{num_blocks}_initial.txt")
+    goal_file = os.path.join(workdir, f"cegis_{name}_{num_blocks}_goal.txt")
+    write_positions(blocks_file, initial_positions)
+    write_positions(goal_file, goal_positions)
+
+    server = MockLLMServer(mode="perturbed", blocks_file=blocks_file, goal_file=goal_file,
+                           perturb_rate=args.perturb_rate, seed=args.seed).start()
+    One_LLM_CEGIS.CLIENT.url = server.url
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            solved, rounds, _, repaired = One_LLM_CEGIS.iterative_planning(args.prompt, blocks_file, goal_file, max_rounds=args.max_rounds,
+                                                                           repair_budget=args.repair_budget)
+        seconds = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    print(f"{'cegis':<14} {name:<10} n={num_blocks:<5} {seconds * 1000:10.2f} ms  solved={solved}, rounds={rounds}, repaired={repaired}")
+    return {"benchmark": "cegis", "scenario": name, "blocks": num_blocks, "seconds": seconds,
+            "solved": solved, "rounds": rounds, "repair_budget": args.repair_budget, "repaired": repaired, "seconds_per_round": seconds / max(rounds, 1)}
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the plan verifier and the CEGIS loop.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--kinds", nargs="+", default=["random", *ADVERSARIAL_KINDS])
+    parser.add_argument("--max-z3-blocks", type=int, default=20, help="largest world for the uninterpreted-function encoding")
+    parser.add_argument("--max-finite-blocks", type=int, default=1000, help="largest world for the finite encoding")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc runs")
+    parser.add_argument("--batch-candidates", type=int, default=10000, help="candidate plans per scenario for the vectorized engine, 0 to skip")
+    parser.add_argument("--cegis-sizes", type=int, nargs="*", default=[5, 10, 20])
+    parser.add_argument("--max-rounds", type=int, default=20)
+    parser.add_argument("--perturb-rate", type=float, default=0.7)
+    parser.add_argument("--repair-budget", type=float, default=0.0, help="seconds of local plan repair per CEGIS round, 0 disables it")
+    parser.add_argument("--prompt", help="prompt file, rendered from the scenario when omitted")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for num_blocks in args.sizes:
+            for kind in args.kinds:
+                if kind == "random":
+                    initial_positions, goal_positions = random_scenario(num_blocks, rng)
+                else:
+                    initial_positions, goal_positions = adversarial_scenario(kind, num_blocks)
+                records.extend(benchmark_scenario(kind, initial_positions, goal_positions, rng, args, workdir))
+
+        for num_blocks in args.cegis_sizes:
+            initial_positions, goal_positions = random_scenario(num_blocks, rng)
+            records.append(benchmark_cegis("random", initial_positions, goal_positions, args, workdir))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "z3": get_version_string(),
+        "arguments": vars(args),
+        "results": records
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(records)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 from z3 import *
 import os
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-from DefineState import define_state
+from DefineState import define_state_from_positions, define_state_from_concrete, define_finite_state, load_block_positions
+from PrefixCache import PrefixCache
+from Telemetry import SolverStats, emit, enabled as telemetry_enabled
+from ActionSchema import ACTIONS, fact
+from ConcreteState import ConcreteState, define_concrete_state, simulate_action, compare_concrete_states, wrong_supports, goal_distance, towers, TABLE, HAND
 
 class State:
     def __init__(self, name):
@@ -55,120 +62,108 @@ def inherit_state(current, next_state, solver, num_blocks, affected=None):
     if 'handsfree' not in affected:
         solver.add(next_state.handsfree() == current.handsfree())
 
-def apply_action(current_state, action_tuple, solver, step, num_blocks):
-    action, *params = action_tuple
-    params = list(map(int, params))
-    next_state = State(f"s{step}")
-    num_blocks = num_blocks
-    
-    if action == "unstack":
-        if len(params) != 2:
-            print(f"Error: Invalid format for action '{action_tuple}'")
-            return None
-        i, j = params
-
-        affected = {
-            'hand': [i],
-            'stacked': [(i, j)],
-            'clear': [i, j],
-            'table': [],    
-            'handsfree': True
-        }
-        inherit_state(current_state, next_state, solver, num_blocks, affected)
-
-        solver.assert_and_track(current_state.clear(i) == True, f"pre_unstack_clear_step_{step}_block_{i}")
-        solver.assert_and_track(current_state.table(i) == False, f"pre_unstack_not_table_step_{step}_block_{i}")
-        solver.assert_and_track(current_state.stacked(i, j) == True, f"pre_unstack_stacked_step_{step}_block_{i}_{j}")
-        solver.assert_and_track(current_state.handsfree() == True, f"pre_unstack_handsfree_step_{step}")
-
-        solver.assert_and_track(next_state.hand(i) == True, f"post_unstack_hand_step_{step}_block_{i}")
-        solver.assert_and_track(next_state.stacked(i, j) == False, f"post_unstack_not_stacked_step_{step}_block_{i}_{j}")
-        solver.assert_and_track(next_state.handsfree() == False, f"post_unstack_not_handsfree_step_{step}")
-        solver.assert_and_track(next_state.clear(j) == True, f"post_unstack_clear_step_{step}_block_{j}")
-        solver.assert_and_track(next_state.clear(i) == False, f"post_unstack_not_clear_step_{step}_block_{i}")
-
-    elif action == "stack":
-        if len(params) != 2:
-            print(f"Error: Invalid format for action '{action_tuple}'")
-            return None
-        i, j = params
-
-        affected = {
-            'hand': [i],
-            'stacked': [(i, j)],
-            'clear': [i, j],
-            'table': [],
-            'handsfree': True
-        }
-        inherit_state(current_state, next_state, solver, num_blocks, affected)
-
-        solver.assert_and_track(current_state.hand(i) == True, f"pre_stack_hand_step_{step}_block_{i}")
-        solver.assert_and_track(current_state.handsfree() == False, f"pre_stack_not_handsfree_step_{step}")
-        solver.assert_and_track(current_state.clear(j) == True, f"pre_stack_clear_step_{step}_block_{j}")
-
-        solver.assert_and_track(next_state.stacked(i, j) == True, f"post_stack_stacked_step_{step}_block_{i}_{j}")
-        solver.assert_and_track(next_state.hand(i) == False, f"post_stack_not_hand_step_{step}_block_{i}")
-        solver.assert_and_track(next_state.handsfree() == True, f"post_stack_handsfree_step_{step}")
-        solver.assert_and_track(next_state.clear(j) == False, f"post_stack_not_clear_step_{step}_block_{j}")
-        solver.assert_and_track(next_state.clear(i) == True, f"post_stack_clear_step_{step}_block_{i}")
-
-    elif action == "pick-up":
-        if len(params) != 1:
-            print(f"Error: Invalid format for action '{action_tuple}'")
-            return None
-        i = params[0]
-
-        affected = {
-            'table': [i],
-            'hand': [i],
-            'handsfree': True
-        }
-        inherit_state(current_state, next_state, solver, num_blocks, affected)
-
-        solver.assert_and_track(current_state.table(i) == True, f"pre_pickup_table_step_{step}_block_{i}")
-        solver.assert_and_track(current_state.handsfree() == True, f"pre_pickup_handsfree_step_{step}")
-        solver.assert_and_track(current_state.clear(i) == True, f"pre_pickup_clear_step_{step}_block_{i}")
-
-        solver.assert_and_track(next_state.hand(i) == True, f"post_pickup_hand_step_{step}_block_{i}")
-        solver.assert_and_track(next_state.handsfree() == False, f"post_pickup_not_handsfree_step_{step}")
-        solver.assert_and_track(next_state.table(i) == False, f"post_pickup_not_table_step_{step}_block_{i}")
-
-    elif action == "put-down":
-        if len(params) != 1:
-            print(f"Error: Invalid format for action '{action_tuple}'")
-            return None
-        i = params[0]
-        affected = {
-            'table': [i],
-            'hand': [i],
-            'clear': [i],
-            'handsfree': True
-        }
-        inherit_state(current_state, next_state, solver, num_blocks, affected)
-
-        solver.assert_and_track(current_state.hand(i) == True, f"pre_putdown_hand_step_{step}_block_{i}")
-        solver.assert_and_track(current_state.handsfree() == False, f"pre_putdown_not_handsfree_step_{step}")
-
-        solver.assert_and_track(next_state.table(i) == True, f"post_putdown_table_step_{step}_block_{i}")
-        solver.assert_and_track(next_state.hand(i) == False, f"post_putdown_not_hand_step_{step}_block_{i}")
-        solver.assert_and_track(next_state.handsfree() == True, f"post_putdown_handsfree_step_{step}")
-        solver.assert_and_track(next_state.clear(i) == True, f"post_putdown_clear_step_{step}_block_{i}")
+def track(solver, constraint, label, assumptions=None):
 
+    # With an assumptions list the constraint is guarded by a literal of the same name,
+    # so the caller decides which steps are enabled in check(*assumptions).
+    if assumptions is None:
+        solver.assert_and_track(constraint, label)
     else:
+        literal = Bool(label)
+        solver.add(Implies(literal, constraint))
+        assumptions.append(literal)
+
+def track_condition(solver, constraint, condition, step, action_tuple, blocks, assumptions=None, labels=None):
+
+    # Tracks one pre/post condition of a compiled action and records what its label
+    # stands for, so an unsat core can be decoded by lookup:
+    # label -> (step, action, kind, blocks).
+    label = condition.label(step, blocks)
+    if labels is not None:
+        labels[label] = (step, action_tuple, f"{condition.phase}_{condition.kind}", blocks)
+    track(solver, constraint, label, assumptions)
+
+def action_template(action_tuple):
+
+    # The compiled action and its integer parameters, or None for an unknown action or
+    # a wrong number of parameters.
+    action, *params = action_tuple
+    params = list(map(int, params))
+    template = ACTIONS.get(action)
+    if template is None:
         print(f"Error: Unknown action '{action}'")
+        return None, params
+    if len(params) != template.arity:
+        print(f"Error: Invalid format for action '{action_tuple}'")
+        return None, params
+    return template, params
+
+# State of every step, shared by all plans: the Z3 declarations only depend on the name.
+step_states = {}
+
+def step_state(step):
+    if step not in step_states:
+        step_states[step] = State(f"s{step}")
+    return step_states[step]
+
+def apply_action(current_state, action_tuple, solver, step, num_blocks, assumptions=None, labels=None):
+    template, params = action_template(action_tuple)
+    if template is None:
         return None
+    next_state = step_state(step)
 
-    if solver.check() == sat:
+    inherit_state(current_state, next_state, solver, num_blocks, template.affected(params))
+
+    for condition in template.conditions:
+        state = current_state if condition.phase == "pre" else next_state
+        blocks = condition.blocks(params)
+        constraint = getattr(state, condition.fluent)(*blocks) == condition.value
+        track_condition(solver, constraint, condition, step, action_tuple, blocks, assumptions, labels)
+
+    if assumptions is not None:
+        return next_state
+
+    if solver_stats.check(solver) == sat:
         #print(f"Action '{action_tuple}' is valid at step {step}.")
         return next_state
     else:
         #print(f"Action '{action_tuple}' is invalid at step {step}.")
         return None
 
-def generate_feedback(failed_step, actions, core):
+def apply_action_finite(current_state, action_tuple, solver, step, assumptions=None, labels=None):
+    template, params = action_template(action_tuple)
+    if template is None:
+        return None
+    next_state = current_state.successor(f"s{step}")
 
-    failed_action = actions[failed_step-1][0]
-    failed_block = actions[failed_step-1][1]
+    for condition in template.conditions:
+        blocks = condition.blocks(params)
+        if condition.phase == "pre":
+            constraint = current_state.get(condition.fluent, *blocks) == condition.value
+        else:
+            constraint = next_state.set(condition.fluent, *blocks) == condition.value
+        track_condition(solver, constraint, condition, step, action_tuple, blocks, assumptions, labels)
+
+    if assumptions is not None:
+        return next_state
+
+    if solver_stats.check(solver) == sat:
+        return next_state
+    else:
+        return None
+
+def describe_condition(condition):
+
+    # (step, action, "pre_not_table", (3,)) -> "precondition `not table(3)` of step 5 `unstack(3,2)`"
+    step, action_tuple, kind, blocks = condition
+    phase, _, fluent = kind.partition("_")
+    action, *params = action_tuple
+    role = "precondition" if phase == "pre" else "effect"
+    return f"{role} `{fact(fluent, blocks)}` of step {step} `{action}({','.join(map(str, params))})`"
+
+def generate_feedback(failed_step, actions, core, conditions=None):
+
+    failed_action, *failed_params = actions[failed_step-1]
 
     feedback = f"""
     **Invalid Action Detected at Step {failed_step}**
@@ -179,222 +174,639 @@ def generate_feedback(failed_step, actions, core):
     UNSAT Core: {core}
     """
 
-    if failed_action == "pick-up":
-        feedback += f"""
-    **Why is this incorrect?**
-    - The block `{failed_block}` is **not clear or not on the table**.
-    - `pick-up(i)` requires that:
-      1. `{failed_block}` is **clear** (no blocks on top of it).
-      2. `{failed_block}` is **directly on the table**.
-
-    **How to fix this?**
-    - If `{failed_block}` is **not clear**, first remove any block stacked on it.
-    - If `{failed_block}` is **not on the table**, you must `unstack({failed_block}, X)` first, then `put-down({failed_block})`.
-
-    **Example Correction**
-    ```plaintext
-    unstack({failed_block}, X)  # First, remove it from another block
-    put-down({failed_block})     # Place it on the table
-    pick-up({failed_block})      # Now, it is clear and on the table
-    ```
+    if conditions:
+        feedback += """
+    **Conflicting Conditions**
     """
+        for condition in sorted(conditions, key=lambda condition: condition[0]):
+            feedback += f"- {describe_condition(condition)}\n    "
 
-    elif failed_action == "unstack":
+    # The preconditions of the action schema, instantiated with the blocks of the step.
+    template = ACTIONS.get(failed_action)
+    if template is not None and len(failed_params) == template.arity:
+        violated = {(kind, blocks) for step, _, kind, blocks in conditions or [] if step == failed_step}
         feedback += f"""
-    **Why is this incorrect?**
-    - `{failed_block}` **is not stacked on `{actions[failed_step-1][2]}`**.
-    - `unstack(x, y)` requires that:
-      1. `x` must be **clear** (no block on top).
-      2. `x` must **not be on the table** (i.e., it should be stacked on `y`).
-      3. The robot's hand must be **empty** before unstacking.
-
-    **How to fix this?**
-    - Ensure that `{failed_block}` is actually stacked on `{actions[failed_step-1][2]}` before attempting `unstack({failed_block}, {actions[failed_step-1][2]})`.
-    - If `{failed_block}` is already on the table, use `pick-up({failed_block})` instead.
-
-    **Example Correction**
-    ```plaintext
-    # If `{failed_block}` is on the table, do this instead:
-    pick-up({failed_block})  
-
-    # If `{failed_block}` is not clear, first remove its top block:
-    unstack(top_block, {failed_block})  
-    ```
+    **Preconditions of `{failed_action}({','.join(failed_params)})`**
     """
+        for condition in template.preconditions:
+            blocks = condition.blocks(failed_params)
+            mark = " (violated)" if (f"pre_{condition.kind}", tuple(map(int, blocks))) in violated else ""
+            feedback += f"- {fact(condition.kind, blocks)}{mark}\n    "
 
-    elif failed_action == "stack":
+        # Why the action fails and how to fix it, written once in the schema.
+        if template.advice:
+            feedback += template.advice.format(**dict(zip(template.params, failed_params)))
+
+    return feedback
+
+
+def generate_report_feedback(report, actions, max_violations=10):
+
+    # One message for every violation found by PlanValidator.diagnose, then the goal
+    # mismatches of the state reached under the recovery policy.
+    violations = report["violations"]
+    feedback = f"""
+    **Diagnosis: {len(violations)} invalid action(s) in a plan of {report["steps"]} steps**
+    Each one is listed below; fix all of them in the next plan.
+    """
+    for violation in violations[:max_violations]:
+        if violation["labels"] is None:
+            feedback += f"""
+    **Unrecognized Action at Step {violation["step"]}**
+    The action `{violation["action"]}` is not one of {", ".join(ACTIONS)} over the known blocks.
+    """
+        else:
+            feedback += generate_feedback(violation["step"], actions, violation["labels"])
+    if len(violations) > max_violations:
+        steps = ", ".join(str(violation["step"]) for violation in violations[max_violations:])
         feedback += f"""
-    **Why is this incorrect?**
-    - `{failed_block}` **cannot be stacked on `{actions[failed_step-1][2]}`** because:
-      1. `{actions[failed_step-1][2]}` is **not clear**.
-      2. `{failed_block}` is **not in the robot's hand**.
-    
-    **How to fix this?**
-    - If `{actions[failed_step-1][2]}` is not clear, first remove any block stacked on it.
-    - Ensure that `{failed_block}` is picked up before attempting to stack it.
-
-    **Example Correction**
-    ```plaintext
-    # If `{actions[failed_step-1][2]}` is not clear:
-    unstack(top_block, {actions[failed_step-1][2]})
-
-    # If `{failed_block}` is not in hand:
-    pick-up({failed_block})
-    stack({failed_block}, {actions[failed_step-1][2]})
-    ```
+    **{len(violations) - max_violations} more invalid action(s)** at steps {steps}.
     """
 
-
-    elif failed_action == "put-down":
+    if report["goal_mismatches"]:
         feedback += f"""
-    **Why is this incorrect?**
-    - `{failed_block}` **cannot be put down** because:
-      1. The robot **is not holding `{failed_block}`**.
-      2. `{failed_block}` **is not picked up yet**.
-    
-    **How to fix this?**
-    - Ensure that `{failed_block}` is in hand before using `put-down({failed_block})`.
-
-    **Example Correction**
-    ```plaintext
-    pick-up({failed_block})  
-    put-down({failed_block})  
-    ```
+    **Goal State Mismatches** (after {"skipping" if report["policy"] == "skip" else "forcing"} the invalid actions)
     """
+        for mismatch in report["goal_mismatches"]:
+            feedback += f"- {mismatch}\n    "
 
     return feedback
 
+def generate_goal_feedback(final_state, goal_state):
 
-def run_plan(plan_text, blocks_file="blocks.txt", goal_file="goal.txt"):
+    # Tower-level diff of a plan whose actions are all valid but that misses the goal.
+    def place(support):
+        if support == TABLE:
+            return "the table"
+        if support == HAND:
+            return "the robot's hand"
+        return f"`{support}`"
 
-    is_valid = False
+    def listing(state):
+        rows, loose = towers(state)
+        text = " | ".join(" ".join(map(str, row)) for row in rows)
+        held = [i for i in loose if state.on[i] == HAND]
+        return text + (f" (holding {', '.join(map(str, held))})" if held else "")
 
-    solver = Solver()
-
-    initial_state, num_blocks = define_state(solver, blocks_file, "s0")
+    wrong = wrong_supports(final_state, goal_state)
+    feedback = f"""
+    **Goal State Not Reached**
+    Every action is valid, but {goal_distance(final_state, goal_state)} block(s) are not in their goal position.
 
-    if os.path.exists(goal_file):
-        goal_state, _ = define_state(solver, goal_file, "goal")
+    **Final towers** (bottom to top, separated by |): {listing(final_state)}
+    **Goal towers** (bottom to top, separated by |): {listing(goal_state)}
+    """
+    if wrong:
+        feedback += """
+    **Blocks on the wrong support**
+    """
+        for i, support, goal_support in wrong:
+            feedback += f"- `{i}` is on {place(support)}, it should be on {place(goal_support)}\n    "
     else:
-        goal_state = None
+        feedback += """
+    **Mismatches**
+    """
+        for mismatch in compare_concrete_states(final_state, goal_state):
+            feedback += f"- {mismatch}\n    "
 
-    states = [initial_state]
-    all_blocks = list(range(1, num_blocks + 1))
+    return feedback
+
+def report_goal_mismatches(mismatches):
+
+    if mismatches:
+        print("The plan is valid, but the final state does not match the goal state.")
+        print("**Mismatches Detected:**")
+        for mismatch in mismatches:
+            print(mismatch)
+        return False
+
+    print("The plan successfully transformed Initial State into Goal State!")
+    return True
+
+def check_assumed_steps(solver, step_assumptions):
+
+    # One check for the whole plan; only if it is unsat, bisect on the enabled prefix
+    # to find the first failing step, so the unsat core matches the step-by-step check.
+    literals, step_ends = [], []
+    for assumptions in step_assumptions:
+        literals.extend(assumptions)
+        step_ends.append(len(literals))
+
+    result = solver_stats.check(solver, *literals)
+    if result != unsat:
+        return result
+
+    lo, hi = 1, len(step_ends)
+    last_unsat = hi
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if solver_stats.check(solver, *literals[:step_ends[mid - 1]]) == unsat:
+            hi = last_unsat = mid
+        else:
+            lo = mid + 1
+            last_unsat = None
+
+    print("Plan failed.")
+    # The core of the last check is still valid if it was the unsat check of this prefix.
+    if last_unsat == lo:
+        return unsat
+    return solver_stats.check(solver, *literals[:step_ends[lo - 1]])
+
+def minimize_core(solver, core, time_budget):
+
+    # Deletion-based minimization: drop a literal whenever the rest is still unsat.
+    # Only possible when the labels are check() assumptions; stops at the budget.
+    deadline = time.perf_counter() + time_budget
+    core = list(core)
+    k = 0
+    try:
+        while k < len(core):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            solver.set("timeout", max(1, int(remaining * 1000)))
+            trial = core[:k] + core[k+1:]
+            if solver_stats.check(solver, *trial) == unsat:
+                kept = {literal.decl().name() for literal in solver.unsat_core()}
+                core = [literal for literal in trial if literal.decl().name() in kept]
+            else:
+                k += 1
+    finally:
+        solver.set("timeout", 4294967295)
+    return core
+
+def report_unsat_core(solver, actions, num_states, labels, core_budget=None, assumed=False):
+
+    print("❌ Final state is unsat.")
+    core = solver.unsat_core()
+    if core_budget and assumed:
+        core = minimize_core(solver, core, core_budget)
+    print("UNSAT Core (Conflicting Constraints):", core)
+    solver_stats.core_size = len(core)
+
+    conditions = [labels[literal.decl().name()] for literal in core if literal.decl().name() in labels]
+    pre_steps = [step for step, _, kind, _ in conditions if kind.startswith("pre_")]
+    post_steps = [step for step, _, kind, _ in conditions if kind.startswith("post_")]
+
+    if pre_steps:
+        failed_step = min(pre_steps)
+    else:
+        failed_step = min(post_steps) if post_steps else -1
 
-    actions = parse_plan(plan_text)
-    current_state = initial_state
-    step = 1
+    prev_step = failed_step - 1
 
-    for action in actions:
-        new_state = apply_action(current_state, action, solver, step, num_blocks)
-        if new_state is None:
-            print("Plan failed.")
-            break
+    # The solver is unsat here, so there is no model of the previous state to show.
+    if prev_step >= 0 and prev_step < num_states:
+        print("**Solver is in `unsat` state, no valid model available.**")
+    else:
+        print("**Previous state is undefined!**")
+
+    return generate_feedback(failed_step, actions, core, conditions)
+
+RECOVERY_POLICIES = ("skip", "force")
+
+# Solver checks of the validation in progress, reported through Telemetry.
+solver_stats = SolverStats()
+
+class PlanValidator:
+    # Parses a scenario once and keeps a base solver holding its initial and goal
+    # states, so every candidate plan only adds its own transitions inside push/pop.
+    def __init__(self, blocks_file="blocks.txt", goal_file="goal.txt", engine="concrete", incremental=True, encoding="function", prefix_cache=None, core_budget=None, window=None, certificate_window=8):
+        self.engine = engine
+        # Seconds spent minimizing unsat cores, None keeps the core Z3 returns.
+        self.core_budget = core_budget
+        # Steps per solver for long plans, None encodes the whole plan in one solver.
+        self.window = window
+        # Steps up to a failure found by the simulator that are encoded for its unsat
+        # core, starting from the simulated state before them. None encodes the whole
+        # prefix from s0, so the core also names effects of earlier steps.
+        self.certificate_window = certificate_window
+        self.incremental = incremental
+        self.encoding = encoding
+        self.prefix_cache = prefix_cache if prefix_cache is not None else PrefixCache()
+
+        initial_positions = load_block_positions(blocks_file)
+        goal_positions = load_block_positions(goal_file) if os.path.exists(goal_file) else None
+        self.scenario_key = hashlib.blake2b(repr(initial_positions).encode(), digest_size=16).digest()
+
+        self.solver = Solver()
+        self.initial_state, self.num_blocks = define_state_from_positions(self.solver, initial_positions, "s0")
+        if goal_positions is not None:
+            self.goal_state, _ = define_state_from_positions(self.solver, goal_positions, "goal")
         else:
+            self.goal_state = None
+
+        # Concrete copies for the simulator and the finite encoding. None when the
+        # scenario can not be represented over blocks 1..n.
+        self.concrete_initial = define_concrete_state(initial_positions)
+        self.concrete_goal = define_concrete_state(goal_positions) if goal_positions is not None else None
+        if self.concrete_initial is not None and goal_positions is not None:
+            if self.concrete_goal is None or self.concrete_goal.num_blocks != self.num_blocks:
+                self.concrete_initial = None
+
+    def validate(self, plan_text):
+        start = time.perf_counter()
+        actions = parse_plan(plan_text)
+        return self.validate_actions(actions, time.perf_counter() - start)
+
+    def validate_actions(self, actions, parse_seconds=None):
+
+        solver_stats.reset()
+        self.assertions, self.goal_seconds = 0, 0.0
+        start = time.perf_counter()
+
+        result = None
+        if self.engine == "concrete":
+            result = self.validate_concrete(actions)
+        if result is None:
+            result = self.validate_solver(actions)
+
+        emit("validation", engine=self.engine, encoding=self.encoding, steps=len(actions), valid=result[0],
+             seconds=time.perf_counter() - start, parse_seconds=parse_seconds, checks=solver_stats.checks,
+             check_seconds=solver_stats.check_seconds, assertions=self.assertions, core_size=solver_stats.core_size,
+             goal_seconds=self.goal_seconds)
+        return result
+
+    def validate_concrete(self, actions):
+
+        # Simulate the plan on the concrete initial state. Returns None when the scenario
+        # or plan can not be decided without the solver.
+        if self.concrete_initial is None:
+            return None
+
+        # Resume from the longest prefix already validated in an earlier round.
+        digests = self.prefix_cache.prefix_digests(actions)
+        start, cached_state = self.prefix_cache.longest_prefix(self.scenario_key, digests)
+        current_state = (cached_state or self.concrete_initial).copy()
+
+        for step in range(start + 1, len(actions) + 1):
+            violations = simulate_action(current_state, actions[step - 1], step)
+            if violations is None:
+                return None
+            if violations:
+                if step > 1:
+                    # Keep the state right before the failure, the usual resume point
+                    # when the next candidate keeps the actions that already passed.
+                    # A failed action leaves the state untouched.
+                    self.prefix_cache.put(self.scenario_key, digests[step - 2], current_state)
+                # Only the failing prefix needs a formal certificate (unsat core) from Z3,
+                # and only its last steps: the cost no longer grows with the prefix.
+                if self.certificate_window:
+                    result = self.validate_windowed(actions[:step], step - 1, self.certificate_window)
+                    if result is not None:
+                        return result
+                return self.validate_solver(actions[:step], trusted=step - 1)
+            if step % self.prefix_cache.checkpoint_interval == 0 or step == len(actions):
+                self.prefix_cache.put(self.scenario_key, digests[step - 1], current_state.copy())
+
+        if self.goal_state:
+            return self.goal_result(current_state)
+
+        return False, "✅ The plan successfully transformed Initial State into Goal State!"
+
+    def final_concrete_state(self, actions):
+
+        # Final state of a plan the solver accepted, None if the simulator can not decide it.
+        if self.concrete_initial is None or self.concrete_goal is None:
+            return None
+        current_state = self.concrete_initial.copy()
+        for step, action in enumerate(actions, start=1):
+            if simulate_action(current_state, action, step) != []:
+                return None
+        return current_state
+
+    def goal_result(self, final_state):
+
+        # Compared to the parsed goal configuration, including which block is on which.
+        print("\nChecking if Final State Matches Goal State:")
+        start = time.perf_counter()
+        mismatches = compare_concrete_states(final_state, self.concrete_goal)
+        self.goal_seconds = time.perf_counter() - start
+        if report_goal_mismatches(mismatches):
+            return True, "✅ The plan successfully transformed Initial State into Goal State!"
+        return False, generate_goal_feedback(final_state, self.concrete_goal)
+
+    def diagnose(self, plan_text, policy="skip"):
+
+        # Keeps simulating past violations instead of stopping at the first one. "skip"
+        # leaves the state untouched, "force" applies the effects of the invalid action.
+        # Returns a report of every violation and the final goal mismatches, or None if
+        # the scenario can not be simulated.
+        if policy not in RECOVERY_POLICIES:
+            raise ValueError(f"Unknown recovery policy '{policy}', expected one of {RECOVERY_POLICIES}")
+        if self.concrete_initial is None:
+            return None
+
+        actions = parse_plan(plan_text)
+        current_state = self.concrete_initial.copy()
+        violations = []
+        for step, action in enumerate(actions, start=1):
+            labels = simulate_action(current_state, action, step, force=policy == "force")
+            if labels is None or labels:
+                violations.append({"step": step, "action": action, "labels": labels})
+
+        mismatches = compare_concrete_states(current_state, self.concrete_goal) if self.concrete_goal else []
+        distance = goal_distance(current_state, self.concrete_goal) if self.concrete_goal else None
+        return {"policy": policy, "steps": len(actions), "violations": violations, "goal_mismatches": mismatches, "goal_distance": distance}
+
+    def progress(self, plan_text):
+
+        # Ranking key for candidates that are not valid: the length of the valid prefix,
+        # then minus the goal distance (blocks still to move) of the state it reaches.
+        if self.concrete_initial is None:
+            return 0, 0
+        current_state = self.concrete_initial.copy()
+
+        valid_steps = 0
+        for step, action in enumerate(parse_plan(plan_text), start=1):
+            if simulate_action(current_state, action, step) != []:
+                break
+            valid_steps = step
+
+        distance = goal_distance(current_state, self.concrete_goal) if self.concrete_goal else 0
+        return valid_steps, -distance
+
+    def validate_solver(self, actions, trusted=0):
+
+        if self.window and self.concrete_initial is not None and len(actions) > self.window:
+            result = self.validate_windowed(actions, trusted)
+            if result is not None:
+                return result
+
+        self.solver.push()
+        try:
+            if self.encoding == "finite" and self.concrete_initial is not None:
+                return self.validate_finite(actions)
+            return self.validate_z3(actions)
+        finally:
+            if telemetry_enabled():
+                self.assertions = len(self.solver.assertions())
+            self.solver.pop()
+
+    def check(self, step_assumptions, solver=None):
+
+        solver = self.solver if solver is None else solver
+        if self.incremental:
+            return check_assumed_steps(solver, step_assumptions)
+        return solver_stats.check(solver)
+
+    def encode_steps(self, solver, current_state, actions, first_step=1, finite=False):
+
+        # Adds the transitions of actions, numbered from first_step, after current_state.
+        # Returns the states reached, the assumption literals of every step and the
+        # label table; stops at the first action that can not be encoded.
+        states = [current_state]
+        step_assumptions = []
+        labels = {}
+
+        for step, action in enumerate(actions, start=first_step):
+            assumptions = [] if self.incremental else None
+            if finite:
+                new_state = apply_action_finite(current_state, action, solver, step, assumptions, labels)
+            else:
+                new_state = apply_action(current_state, action, solver, step, self.num_blocks, assumptions, labels)
+            if new_state is None:
+                print("Plan failed.")
+                break
             states.append(new_state)
             current_state = new_state
-            #print(f"\n=== State after action {action} (step {step}) ===")
-            #print_state(current_state, solver, num_blocks)
-            step += 1
+            if self.incremental:
+                step_assumptions.append(assumptions)
+
+        return states, step_assumptions, labels
+
+    def validate_windowed(self, actions, trusted=0, window=None):
+
+        # Validates the plan window steps at a time, each in a fresh solver that starts
+        # from the simulated state at the window boundary, so memory is bounded by the
+        # window instead of the plan. Labels keep the global step numbers; a conflict
+        # with a step before the window shows up as the untracked boundary state.
+        # The first trusted steps were already accepted by the simulator and are only
+        # encoded in the window that ends at the first untrusted step. Returns None if
+        # the simulator can not carry the state across a boundary.
+        window = window or self.window
+        first = max(0, trusted + 1 - window)
+        state = self.concrete_initial.copy()
+        for step, action in enumerate(actions[:first], start=1):
+            simulate_action(state, action, step)
+
+        finite = self.encoding == "finite"
+        for start in range(first, len(actions), window):
+            steps = actions[start:start + window]
+            solver = Solver()
+            if finite:
+                current_state = define_finite_state(state, f"s{start}")
+            else:
+                current_state = define_state_from_concrete(solver, state, f"s{start}")
 
-    #print("\n=== Final State ===")
+            states, step_assumptions, labels = self.encode_steps(solver, current_state, steps, start + 1, finite)
+            result = self.check(step_assumptions, solver)
+            if telemetry_enabled():
+                self.assertions = max(self.assertions, len(solver.assertions()))
+            if result != sat:
+                return False, report_unsat_core(solver, actions, start + len(states), labels, self.core_budget, self.incremental)
 
-    if solver.check() == sat:
-        #print_state(current_state, solver, num_blocks)
+            for step, action in enumerate(steps, start=start + 1):
+                if simulate_action(state, action, step) != []:
+                    print(f"Step {step} can not be simulated, validating the plan in one solver.")
+                    return None
 
-        mismatches = []
+        if self.goal_state:
+            return self.goal_result(state)
+        return False, "✅ The plan successfully transformed Initial State into Goal State!"
 
-        if goal_state:
-            print("\nChecking if Final State Matches Goal State:")
+    def validate_z3(self, actions):
 
-            model = solver.model()
-            for i in all_blocks:
-                table_final = model.eval(current_state.table(i), model_completion=True)
-                table_goal = model.eval(goal_state.table(i), model_completion=True)
-                if not (table_final == table_goal):
-                    mismatches.append(f"table({i}) mismatch: Final({table_final}) ≠ Goal({table_goal})")
-
-                hand_final = model.eval(current_state.hand(i), model_completion=True)
-                hand_goal = model.eval(goal_state.hand(i), model_completion=True)
-                if not (hand_final == hand_goal):
-                    mismatches.append(f"hand({i}) mismatch: Final({hand_final}) ≠ Goal({hand_goal})")
-
-                clear_final = model.eval(current_state.clear(i), model_completion=True)
-                clear_goal = model.eval(goal_state.clear(i), model_completion=True)
-                if not (clear_final == clear_goal):
-                    mismatches.append(f"clear({i}) mismatch: Final({clear_final}) ≠ Goal({clear_goal})")
-
-            handsfree_final = model.eval(current_state.handsfree(), model_completion=True)
-            handsfree_goal = model.eval(goal_state.handsfree(), model_completion=True)
-            if not (handsfree_final == handsfree_goal):
-                mismatches.append(f"handsfree mismatch: Final({handsfree_final}) ≠ Goal({handsfree_goal})")
-
-            if mismatches:
-                print("The plan is valid, but the final state does not match the goal state.")
-                print("**Mismatches Detected:**")
-                for mismatch in mismatches:
-                    print(mismatch)
-            else:
-                is_valid = True
-                print("The plan successfully transformed Initial State into Goal State!")
+        is_valid = False
+        solver = self.solver
+        num_blocks = self.num_blocks
+        goal_state = self.goal_state
 
-    else:
-        print("❌ Final state is unsat.")
-        core = solver.unsat_core()
-        print("UNSAT Core (Conflicting Constraints):", core)
-
-        pre_steps, post_steps = [], []
-        for constraint in core:
-            constraint_str = str(constraint)
-            if "step_" in constraint_str:
-                parts = constraint_str.split("step_")[-1].split("_")
-                if parts[0].isdigit():
-                    step_num = int(parts[0])
-                    if "pre_" in constraint_str:
-                        pre_steps.append(step_num)
-                    elif "post_" in constraint_str:
-                        post_steps.append(step_num)
-
-        if pre_steps:
-            failed_step = min(pre_steps)
-        else:
-            failed_step = min(post_steps) if post_steps else -1
+        all_blocks = list(range(1, num_blocks + 1))
 
-        prev_step = failed_step - 1
+        states, step_assumptions, labels = self.encode_steps(solver, self.initial_state, actions)
+        current_state = states[-1]
 
-        #print(f"\n**Invalid Action at Step {failed_step}:** {actions[failed_step-1]}")
-        
-        if prev_step >= 0 and prev_step < len(states):
-            #print(f"**Previous State after Step {prev_step}:**")
-            
-            if solver.check() == sat:
-                model = solver.model()
+        #print("\n=== Final State ===")
 
-                prev_table = {i: model.eval(states[prev_step].table(i), model_completion=True) for i in range(1, num_blocks + 1)}
-                prev_hand = {i: model.eval(states[prev_step].hand(i), model_completion=True) for i in range(1, num_blocks + 1)}
-                prev_clear = {i: model.eval(states[prev_step].clear(i), model_completion=True) for i in range(1, num_blocks + 1)}
-                prev_handsfree = model.eval(states[prev_step].handsfree(), model_completion=True)
+        result = self.check(step_assumptions)
 
-                # Print Previous State**
-                #print("\n**Previous State (Step {prev_step})**")
-                #print(f"- Table Status: {prev_table}")
-                #print(f"- Hand Status: {prev_hand}")
-                #print(f"- Block Clearance: {prev_clear}")
-                #print(f"- Handsfree: {prev_handsfree}")
+        if result == sat:
+            #print_state(current_state, solver, num_blocks)
+
+            mismatches = []
+
+            # Without the model when the simulator can replay the accepted steps.
+            final_state = self.final_concrete_state(actions[:len(states) - 1]) if goal_state else None
+            if final_state is not None:
+                return self.goal_result(final_state)
+
+            if goal_state:
+                print("\nChecking if Final State Matches Goal State:")
+
+                model = solver.model()
+                for i in all_blocks:
+                    table_final = model.eval(current_state.table(i), model_completion=True)
+                    table_goal = model.eval(goal_state.table(i), model_completion=True)
+                    if not (table_final == table_goal):
+                        mismatches.append(f"table({i}) mismatch: Final({table_final}) ≠ Goal({table_goal})")
+
+                    hand_final = model.eval(current_state.hand(i), model_completion=True)
+                    hand_goal = model.eval(goal_state.hand(i), model_completion=True)
+                    if not (hand_final == hand_goal):
+                        mismatches.append(f"hand({i}) mismatch: Final({hand_final}) ≠ Goal({hand_goal})")
+
+                    clear_final = model.eval(current_state.clear(i), model_completion=True)
+                    clear_goal = model.eval(goal_state.clear(i), model_completion=True)
+                    if not (clear_final == clear_goal):
+                        mismatches.append(f"clear({i}) mismatch: Final({clear_final}) ≠ Goal({clear_goal})")
+
+                handsfree_final = model.eval(current_state.handsfree(), model_completion=True)
+                handsfree_goal = model.eval(goal_state.handsfree(), model_completion=True)
+                if not (handsfree_final == handsfree_goal):
+                    mismatches.append(f"handsfree mismatch: Final({handsfree_final}) ≠ Goal({handsfree_goal})")
+
+                is_valid = report_goal_mismatches(mismatches)
+                if not is_valid:
+                    return False, "The final state does not match the goal state:\n" + "\n".join(mismatches)
 
-            else:
-                print("**Solver is in `unsat` state, no valid model available.**")
         else:
-            print("**Previous state is undefined!**")
+            return False, report_unsat_core(solver, actions, len(states), labels, self.core_budget, self.incremental)
+
+        return is_valid, "✅ The plan successfully transformed Initial State into Goal State!"
+
+    def validate_finite(self, actions):
 
-        feedback = generate_feedback(failed_step, actions, core)
+        # Same checks as validate_z3 over the Boolean encoding of DefineState.FiniteState.
+        solver = self.solver
+        states, step_assumptions, labels = self.encode_steps(solver, define_finite_state(self.concrete_initial, "s0"), actions, finite=True)
+        current_state = states[-1]
 
-        #print(feedback)
-        return False, feedback
-    
-    return is_valid, "✅ The plan successfully transformed Initial State into Goal State!"
+        result = self.check(step_assumptions)
 
-        
+        if result != sat:
+            return False, report_unsat_core(solver, actions, len(states), labels, self.core_budget, self.incremental)
+
+        is_valid = False
+        final_state = self.final_concrete_state(actions[:len(states) - 1]) if self.goal_state else None
+        if final_state is not None:
+            return self.goal_result(final_state)
+
+        if self.goal_state:
+            print("\nChecking if Final State Matches Goal State:")
+
+            # Steps the simulator can not decide: fall back to the fluents of the model.
+            model = solver.model()
+            final_state = ConcreteState(self.num_blocks)
+            for i in range(1, self.num_blocks + 1):
+                final_state.table[i] = is_true(model.eval(current_state.get("table", i), model_completion=True))
+                final_state.hand[i] = is_true(model.eval(current_state.get("hand", i), model_completion=True))
+                final_state.clear[i] = is_true(model.eval(current_state.get("clear", i), model_completion=True))
+            final_state.handsfree = is_true(model.eval(current_state.get("handsfree"), model_completion=True))
+
+            mismatches = compare_concrete_states(final_state, self.concrete_goal, supports=False)
+            is_valid = report_goal_mismatches(mismatches)
+            if not is_valid:
+                return False, "The final state does not match the goal state:\n" + "\n".join(mismatches)
+
+        return is_valid, "✅ The plan successfully transformed Initial State into Goal State!"
+
+class PlanStream:
+    # Checks a plan line by line while it is still being generated, so the request can
+    # be cancelled at the first action that violates a precondition.
+    def __init__(self, validator):
+        self.validator = validator
+        self.actions = []
+        self.failed_step = None
+        initial = validator.concrete_initial
+        self.state = initial.copy() if validator.engine == "concrete" and initial is not None else None
+
+    def feed(self, line):
+
+        # Returns False once the plan is known to fail.
+        for action in parse_plan(line):
+            self.actions.append(action)
+            if self.state is None or self.failed_step is not None:
+                continue
+            violations = simulate_action(self.state, action, len(self.actions))
+            if violations is None:
+                # Undecidable without the solver, the complete plan is validated at the end.
+                self.state = None
+            elif violations:
+                self.failed_step = len(self.actions)
+        return self.failed_step is None
+
+    def result(self, plan_text):
+
+        # Same verdict and feedback as validate(plan_text) on the complete plan.
+        if self.failed_step is not None:
+            return self.validator.validate_actions(self.actions[:self.failed_step])
+        return self.validator.validate(plan_text)
+
+def run_plan(plan_text, blocks_file="blocks.txt", goal_file="goal.txt", engine="concrete", incremental=True, encoding="function", window=None):
+
+    validator = PlanValidator(blocks_file, goal_file, engine, incremental, encoding, window=window)
+    return validator.validate(plan_text)
+
+# Warm validators of a batch worker process, keyed by scenario files and their mtimes.
+worker_validators = {}
+
+def get_worker_validator(blocks_file, goal_file):
+
+    goal_mtime = os.path.getmtime(goal_file) if os.path.exists(goal_file) else None
+    key = (blocks_file, goal_file, os.path.getmtime(blocks_file), goal_mtime)
+    if key not in worker_validators:
+        worker_validators[key] = PlanValidator(blocks_file, goal_file)
+    return worker_validators[key]
+
+def validate_in_worker(plan_text, blocks_file, goal_file):
+    return get_worker_validator(blocks_file, goal_file).validate(plan_text)
+
+def run_plan_batch(plans, blocks_file="blocks.txt", goal_file="goal.txt", workers=None, stop_on_first_valid=False, executor=None):
+
+    # Returns the run_plan results in input order. With stop_on_first_valid the list
+    # ends at the first valid plan and the plans after it are not validated.
+    if executor is None and (workers == 1 or len(plans) <= 1):
+        validator = PlanValidator(blocks_file, goal_file)
+        results = []
+        for plan_text in plans:
+            results.append(validator.validate(plan_text))
+            if stop_on_first_valid and results[-1][0]:
+                break
+        return results
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    try:
+        futures = [executor.submit(validate_in_worker, plan_text, blocks_file, goal_file) for plan_text in plans]
+        if not stop_on_first_valid:
+            return [future.result() for future in futures]
+
+        index = {future: i for i, future in enumerate(futures)}
+        results = [None] * len(plans)
+        first_valid = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                i = index[future]
+                results[i] = future.result()
+                if results[i][0] and (first_valid is None or i < first_valid):
+                    first_valid = i
+            if first_valid is not None:
+                for future in list(pending):
+                    if index[future] > first_valid:
+                        future.cancel()
+                        pending.discard(future)
+
+        return results if first_valid is None else results[:first_valid + 1]
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,172 @@
+from functools import lru_cache
+
+from ActionSchema import ACTIONS, TABLE, HAND
+
+
+class ConcreteState:
+    __slots__ = ("num_blocks", "table", "hand", "clear", "stacked", "handsfree", "on")
+
+    def __init__(self, num_blocks):
+        self.num_blocks = num_blocks
+        self.table = [False] * (num_blocks + 1)
+        self.hand = [False] * (num_blocks + 1)
+        self.clear = [False] * (num_blocks + 1)
+        # Known stacked(i, j) values. Pairs that were never constrained are left out,
+        # exactly like the uninterpreted stacked function in the Z3 encoding.
+        self.stacked = {}
+        self.handsfree = True
+        # Physical support of every block: a block number, TABLE or HAND. Unlike the
+        # fluents above it follows where blocks really are, also after an unstack
+        # from the wrong block.
+        self.on = [TABLE] * (num_blocks + 1)
+
+    def copy(self):
+        state = ConcreteState.__new__(ConcreteState)
+        state.num_blocks = self.num_blocks
+        state.table = self.table[:]
+        state.hand = self.hand[:]
+        state.clear = self.clear[:]
+        state.stacked = dict(self.stacked)
+        state.handsfree = self.handsfree
+        state.on = self.on[:]
+        return state
+
+def define_concrete_state(block_positions):
+
+    all_blocks = set(sum(block_positions, []))
+    num_blocks = len(all_blocks)
+
+    # Blocks outside 1..num_blocks are not covered by the frame axioms of the Z3
+    # encoding, so such scenarios are left to the solver.
+    if all_blocks != set(range(1, num_blocks + 1)):
+        return None
+
+    state = ConcreteState(num_blocks)
+    for row in block_positions:
+        state.table[row[0]] = True
+        state.clear[row[-1]] = True
+        for i in range(len(row) - 1):
+            state.stacked[(row[i+1], row[i])] = True
+            state.on[row[i+1]] = row[i]
+    return state
+
+@lru_cache(maxsize=1 << 16)
+def bind_action(action_tuple):
+
+    # The compiled action with the blocks of every condition resolved, or None for an
+    # unknown action or bad parameters. Plans repeat the same actions, so each distinct
+    # action is bound once: (params, preconditions, conflicts, effects, support).
+    action, *params = action_tuple
+    template = ACTIONS.get(action)
+    if template is None:
+        return None
+    try:
+        params = tuple(map(int, params))
+    except ValueError:
+        return None
+    if len(params) != template.arity:
+        return None
+    preconditions = [(condition, condition.fluent, condition.blocks(params), condition.value) for condition in template.preconditions]
+    conflicts = [(add, add.blocks(params)) for add, delete in template.conflicts if add.blocks(params) == delete.blocks(params)]
+    effects = [(effect.fluent, effect.blocks(params), effect.value) for effect in template.effects]
+    return params, preconditions, conflicts, effects, template.support_of(params)
+
+def simulate_action(state, action_tuple, step, force=False):
+
+    # Returns the labels of the violated constraints (empty if the action is valid, in
+    # which case the state is updated in place), or None if the action can not be
+    # decided without the solver. With force the effects are applied even if some
+    # precondition is violated.
+    bound = bind_action(action_tuple)
+    if bound is None:
+        return None
+    params, preconditions, conflicts, effects, support = bound
+    if any(p < 1 or p > state.num_blocks for p in params):
+        return None
+
+    # A stacked pair that was never constrained satisfies either value.
+    violations = []
+    for condition, fluent, blocks, value in preconditions:
+        if not blocks:
+            current = getattr(state, fluent)
+        elif len(blocks) == 1:
+            current = getattr(state, fluent)[blocks[0]]
+        else:
+            current = getattr(state, fluent).get(blocks, value)
+        if current != value:
+            violations.append(condition.label(step, blocks))
+    for add, blocks in conflicts:
+        violations.append(add.label(step, blocks))
+    if violations and not force:
+        return violations
+
+    for fluent, blocks, value in effects:
+        if not blocks:
+            setattr(state, fluent, value)
+        elif len(blocks) == 1:
+            getattr(state, fluent)[blocks[0]] = value
+        else:
+            getattr(state, fluent)[blocks] = value
+    if support is not None:
+        state.on[support[0]] = support[1]
+    return violations
+
+def compare_concrete_states(final_state, goal_state, supports=True):
+
+    mismatches = []
+    for i in range(1, final_state.num_blocks + 1):
+        if final_state.table[i] != goal_state.table[i]:
+            mismatches.append(f"table({i}) mismatch: Final({final_state.table[i]}) ≠ Goal({goal_state.table[i]})")
+        if final_state.hand[i] != goal_state.hand[i]:
+            mismatches.append(f"hand({i}) mismatch: Final({final_state.hand[i]}) ≠ Goal({goal_state.hand[i]})")
+        if final_state.clear[i] != goal_state.clear[i]:
+            mismatches.append(f"clear({i}) mismatch: Final({final_state.clear[i]}) ≠ Goal({goal_state.clear[i]})")
+    if final_state.handsfree != goal_state.handsfree:
+        mismatches.append(f"handsfree mismatch: Final({final_state.handsfree}) ≠ Goal({goal_state.handsfree})")
+    for i, support, goal_support in wrong_supports(final_state, goal_state) if supports else []:
+        mismatches.append(f"on({i}) mismatch: Final({support_name(support)}) ≠ Goal({support_name(goal_support)})")
+    return mismatches
+
+def support_name(support):
+    return {TABLE: "table", HAND: "hand"}.get(support, str(support))
+
+def wrong_supports(final_state, goal_state):
+    return [(i, final_state.on[i], goal_state.on[i]) for i in range(1, final_state.num_blocks + 1) if final_state.on[i] != goal_state.on[i]]
+
+def goal_distance(final_state, goal_state):
+
+    # Number of blocks that still have to move: a block is in place only if it sits on
+    # its goal support and that support is in place too, down to the table. O(n).
+    in_place = [None] * (final_state.num_blocks + 1)
+    for i in range(1, final_state.num_blocks + 1):
+        chain = []
+        block = i
+        while block > 0 and in_place[block] is None and block not in chain:
+            chain.append(block)
+            if final_state.on[block] != goal_state.on[block]:
+                in_place[block] = False
+                chain.pop()
+                break
+            block = final_state.on[block]
+        placed = in_place[block] if block > 0 and in_place[block] is not None else block == TABLE
+        for block in reversed(chain):
+            in_place[block] = placed
+    return sum(1 for i in range(1, final_state.num_blocks + 1) if not in_place[i])
+
+def towers(state):
+
+    # Towers bottom to top rebuilt from the supports, then blocks held or not reachable
+    # from the table.
+    above = {}
+    for i in range(1, state.num_blocks + 1):
+        above.setdefault(state.on[i], []).append(i)
+    rows, seen = [], set()
+    for bottom in above.get(TABLE, []):
+        row = [bottom]
+        while above.get(row[-1]) and row[-1] not in seen:
+            seen.add(row[-1])
+            row.append(above[row[-1]][0])
+        seen.add(row[-1])
+        rows.append(row)
+    loose = [i for i in range(1, state.num_blocks + 1) if i not in seen]
+    return rows, loose
@@ -0,0 +1,64 @@
+import re
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token, good enough for budgeting.
+    return len(text) // 4 + 1
+
+def summarize_feedback(feedback):
+
+    # First two lines of a feedback message without markdown, e.g.
+    # "Invalid Action Detected at Step 24: The action `('stack', '7', '9')` is invalid ..."
+    lines = [re.sub(r"\*\*", "", line).strip() for line in feedback.splitlines()]
+    lines = [line for line in lines if line]
+    return ": ".join(lines[:2])
+
+def feedback_message(feedback):
+    return f"Your previous plan had an issue:\n{feedback}\nPlease correct your plan accordingly."
+
+class Conversation:
+    # Chat history for one CEGIS session. The system message and the problem prompt are
+    # always sent, followed by the latest keep_rounds candidates with their feedback and
+    # a one-line summary per earlier failed round, all within token_budget.
+    def __init__(self, system_prompt, problem_prompt, token_budget=16000, keep_rounds=1):
+        self.pinned = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": problem_prompt}
+        ]
+        self.token_budget = token_budget
+        self.keep_rounds = keep_rounds
+        self.rounds = []
+
+    def add_round(self, plan_text, feedback, summary=None):
+        self.rounds.append((plan_text, feedback_message(feedback), summary or summarize_feedback(feedback)))
+
+    def messages(self):
+
+        budget = self.token_budget - sum(estimate_tokens(message["content"]) for message in self.pinned)
+
+        # Latest rounds first; the last one is always kept, even over the budget.
+        recent = []
+        for plan_text, feedback, _ in reversed(self.rounds[-self.keep_rounds:]):
+            cost = estimate_tokens(plan_text) + estimate_tokens(feedback)
+            if recent and cost > budget:
+                break
+            recent.insert(0, [{"role": "assistant", "content": plan_text}, {"role": "user", "content": feedback}])
+            budget -= cost
+
+        # Earlier rounds as one summary message, newest lines kept first.
+        older = self.rounds[:len(self.rounds) - len(recent)]
+        lines = []
+        for number, (_, _, summary) in reversed(list(enumerate(older, start=1))):
+            line = f"- Round {number}: {summary}"
+            if estimate_tokens(line) > budget:
+                break
+            lines.insert(0, line)
+            budget -= estimate_tokens(line)
+
+        messages = list(self.pinned)
+        if lines:
+            summary = "Earlier plans failed as follows, do not repeat these mistakes:\n" + "\n".join(lines)
+            messages.append({"role": "user", "content": summary})
+        for pair in recent:
+            messages.extend(pair)
+        return messages
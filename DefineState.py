@@ -9,14 +9,103 @@ class State:
         self.clear = Function(f'{name}_clear', IntSort(), BoolSort())
         self.handsfree = Function(f'{name}_handsfree', BoolSort())
 
-def define_state(solver, filename, state_name):
+class FiniteState:
+    # Boolean encoding with one variable per (fluent, block). Fluents an action does not
+    # touch keep the variable of the previous state, so no frame axioms are needed.
+    def __init__(self, name, num_blocks, free_stacked=None):
+        self.name = name
+        self.num_blocks = num_blocks
+        self.table = {}
+        self.hand = {}
+        self.clear = {}
+        self.stacked = {}
+        self.handsfree = None
+        # stacked(i, j) pairs never constrained in the initial state are created lazily
+        # and shared by all states of the plan.
+        self.free_stacked = {} if free_stacked is None else free_stacked
+        # Fluents of blocks outside 1..num_blocks are not inherited between states.
+        self.loose = {}
+        self.written = {}
+
+    def in_range(self, blocks):
+        return all(1 <= b <= self.num_blocks for b in blocks)
+
+    def get(self, fluent, *blocks):
+        if fluent == "handsfree":
+            return self.handsfree
+        key = blocks[0] if len(blocks) == 1 else blocks
+        if not self.in_range(blocks):
+            if (fluent, key) not in self.loose:
+                self.loose[(fluent, key)] = Bool(f"{self.name}_{fluent}_" + "_".join(map(str, blocks)))
+            return self.loose[(fluent, key)]
+        values = getattr(self, fluent)
+        if key not in values:
+            values[key] = self.free_stacked.setdefault(key, Bool(f"free_stacked_{blocks[0]}_{blocks[1]}"))
+        return values[key]
+
+    def set(self, fluent, *blocks):
+        if (fluent, blocks) in self.written:
+            return self.written[(fluent, blocks)]
+        var = Bool(f"{self.name}_{fluent}" + "".join(f"_{b}" for b in blocks))
+        key = blocks[0] if len(blocks) == 1 else blocks
+        if fluent == "handsfree":
+            self.handsfree = var
+        elif self.in_range(blocks):
+            getattr(self, fluent)[key] = var
+        else:
+            self.loose[(fluent, key)] = var
+        self.written[(fluent, blocks)] = var
+        return var
+
+    def successor(self, name):
+        state = FiniteState(name, self.num_blocks, self.free_stacked)
+        state.table = dict(self.table)
+        state.hand = dict(self.hand)
+        state.clear = dict(self.clear)
+        state.stacked = dict(self.stacked)
+        state.handsfree = self.handsfree
+        return state
+
+def define_finite_state(concrete_state, state_name):
+
+    state = FiniteState(state_name, concrete_state.num_blocks)
+    for block in range(1, concrete_state.num_blocks + 1):
+        state.table[block] = BoolVal(concrete_state.table[block])
+        state.hand[block] = BoolVal(concrete_state.hand[block])
+        state.clear[block] = BoolVal(concrete_state.clear[block])
+    for pair, value in concrete_state.stacked.items():
+        state.stacked[pair] = BoolVal(value)
+    state.handsfree = BoolVal(concrete_state.handsfree)
+    return state
+
+def define_state_from_concrete(solver, concrete_state, state_name):
 
+    # Function encoding of a simulated state, e.g. at a window boundary. stacked is only
+    # constrained for the pairs the simulator knows, the others stay open.
     state = State(state_name)
+    for block in range(1, concrete_state.num_blocks + 1):
+        solver.add(state.table(block) == concrete_state.table[block])
+        solver.add(state.hand(block) == concrete_state.hand[block])
+        solver.add(state.clear(block) == concrete_state.clear[block])
+    for (i, j), value in concrete_state.stacked.items():
+        solver.add(state.stacked(i, j) == value)
+    solver.add(state.handsfree() == concrete_state.handsfree)
+    return state
+
+def load_block_positions(filename):
 
     with open(filename, "r") as f:
         lines = f.readlines()
-    
-    block_positions = [list(map(int, line.strip().split(","))) for line in lines if line.strip()]
+
+    return [list(map(int, line.strip().split(","))) for line in lines if line.strip()]
+
+def define_state(solver, filename, state_name):
+
+    return define_state_from_positions(solver, load_block_positions(filename), state_name)
+
+def define_state_from_positions(solver, block_positions, state_name):
+
+    state = State(state_name)
 
     all_blocks = set(sum(block_positions, [])) 
     num_blocks = len(all_blocks)
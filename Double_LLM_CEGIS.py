@@ -1,71 +1,99 @@
-import requests
 import json
 import re
 import os
 import time
-from CheckConstrains import run_plan
+from concurrent.futures import ProcessPoolExecutor
+from CheckConstrains import PlanValidator, PlanStream, parse_plan, run_plan_batch, generate_report_feedback
+from LLMClient import LLMClient, LLMError, is_fatal, completion_contents
+from ResponseCache import ResponseCache
+from ExplanationCache import ExplanationCache, failure_signature
+from PromptBuilder import build_prompt
+from PlanRepair import repair_plan
+from Planner import format_action
+from ConversationManager import Conversation, summarize_feedback
+from Telemetry import emit, add_hook, JsonLinesHook
 
 
 API_KEY = "replace it with your own API"
 EXP_API_KEY = "replace it with your own API"
-GPT_URL = "https://api.openai.com/v1/chat/completions"
+GPT_URL = os.environ.get("GPT_URL", "https://api.openai.com/v1/chat/completions")  # point at MockLLMServer for offline runs
 
-# HTTP Head
-HEADERS = {
-    "Authorization": f"Bearer {API_KEY}",
-    "Content-Type": "application/json"
-}
+# Response cache: "record", "replay" (no network) or "passthrough"
+CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "passthrough")
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite")
+CACHE = ResponseCache(CACHE_PATH, CACHE_MODE) if CACHE_MODE != "passthrough" else None
 
-EXP_HEADERS = {
-    "Authorization": f"Bearer {EXP_API_KEY}",
-    "Content-Type": "application/json"
-}
+# Pooled HTTP clients, retries 429/5xx with backoff
+CLIENT = LLMClient(GPT_URL, API_KEY, cache=CACHE)
+EXP_CLIENT = LLMClient(GPT_URL, EXP_API_KEY, cache=CACHE)
 
-def call_gpt(history, use_exp_api=False, model="gpt-4o", max_tokens=8000, temperature=0.7, top_p=0.9, timeout_limit=30):
-    headers = EXP_HEADERS if use_exp_api else HEADERS  # select different API key
+# Explanations reused across rounds for failures of the same kind, 0 disables it
+EXPLANATION_CACHE = ExplanationCache(int(os.environ.get("EXPLANATION_CACHE_SIZE", 256)))
+
+# Per-round timings, token counts and solver statistics as JSON lines
+TELEMETRY_FILE = os.environ.get("TELEMETRY_FILE")
+if TELEMETRY_FILE:
+    add_hook(JsonLinesHook(TELEMETRY_FILE))
+
+def call_gpt(history, use_exp_api=False, model="gpt-4o", max_tokens=8000, temperature=0.7, top_p=0.9, timeout_limit=30, n=1):
+    client = EXP_CLIENT if use_exp_api else CLIENT  # select different API key
 
     payload = {
         "model": model,
         "messages": history,
         "max_tokens": max_tokens,
         "temperature": temperature,
-        "top_p": top_p
+        "top_p": top_p,
+        "n": n
     }
 
-    try:
-        start_time = time.time()
-        response = requests.post(GPT_URL, json=payload, headers=headers, timeout=timeout_limit)
-        end_time = time.time()
-
-        print(f"HTTP code: {response.status_code}")
-        print(f"API answer time: {end_time - start_time:.2f} 秒")
+    # Raises LLMError once the retries are exhausted
+    start_time = time.time()
+    response_data = client.complete(payload, timeout=timeout_limit)
+    end_time = time.time()
 
-        if response.status_code != 200:
-            print(f"API request failed: {response.text}")
-            return f"ERROR: API request failed ({response.status_code})"
+    print(f"API answer time: {end_time - start_time:.2f} 秒")
+    usage = response_data.get("usage") or {}
+    emit("llm_call", role="explanation" if use_exp_api else "answer", seconds=end_time - start_time, n=n, stream=False,
+         prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
 
-        response_data = response.json()
-
-        if "choices" in response_data and len(response_data["choices"]) > 0:
-            return response_data["choices"][0]["message"]["content"]
-        else:
-            print("Invalid JSON structure")
-            return "ERROR: Invalid JSON structure"
+    contents = completion_contents(response_data)
+    if n > 1:
+        return contents
+    return contents[0]
+    
+def call_answer_api(history, n=1):
+    return call_gpt(history, use_exp_api=False, n=n)
 
-    except requests.exceptions.Timeout:
-        print("API request timeout")
-        return "ERROR: API request timeout"
+def stream_answer_api(history, on_line, model="gpt-4o", max_tokens=8000, temperature=0.7, top_p=0.9, timeout_limit=30):
 
-    except requests.exceptions.RequestException as e:
-        print(f"API request failed")
-        return "ERROR: API request failed"
+    payload = {
+        "model": model,
+        "messages": history,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p
+    }
 
-    except json.JSONDecodeError:
-        print("ERROR: Invalid JSON format")
-        return "ERROR: Invalid JSON format"
-    
-def call_answer_api(history):
-    return call_gpt(history, use_exp_api=False)
+    # Returns the text received before on_line cancelled the stream; a cancelled
+    # stream ends before the usage chunk, so its tokens are reported as None.
+    first_line = []
+    def timed_line(line):
+        if not first_line:
+            first_line.append(time.time())
+        return on_line(line)
+
+    before = dict(CLIENT.usage)
+    start_time = time.time()
+    content = CLIENT.stream(payload, timed_line, timeout=timeout_limit)
+    end_time = time.time()
+
+    print(f"API answer time: {end_time - start_time:.2f} 秒")
+    emit("llm_call", role="answer", seconds=end_time - start_time, n=1, stream=True,
+         first_line_seconds=first_line[0] - start_time if first_line else None,
+         prompt_tokens=CLIENT.usage["prompt_tokens"] - before["prompt_tokens"] or None,
+         completion_tokens=CLIENT.usage["completion_tokens"] - before["completion_tokens"] or None)
+    return content
 
 def call_explanation_api(error_message):
     prompt = f"""
@@ -122,50 +150,127 @@ def format_plan_text(plan):
     return str(plan).strip()
 
 
-def iterative_planning(prompt_file="prompt.txt", blocks_file="initial.txt", goal_file="goal.txt"):
+def iterative_planning(prompt_file=None, blocks_file="initial.txt", goal_file="goal.txt", samples=1, max_rounds=None, stream=False, repair_budget=0.5, diagnose=None, token_budget=16000):
 
-    with open(prompt_file, "r", encoding="utf-8") as file:
-        initial_prompt = file.read()
+    # Without a prompt file the prompt is rendered from the scenario files.
+    if prompt_file is None:
+        initial_prompt = build_prompt(blocks_file, goal_file)
+    else:
+        with open(prompt_file, "r", encoding="utf-8") as file:
+            initial_prompt = file.read()
+
+    validator = PlanValidator(blocks_file, goal_file)
+    # With several samples per round the candidates are validated in parallel.
+    executor = ProcessPoolExecutor(max_workers=samples) if samples > 1 else None
 
     round_count = 0
-    history = [{"role": "system", "content": "You are an expert planner for the Blocks World problem."}]
-    history.append({"role": "user", "content": initial_prompt})
-
-    max_history_length = 100
-
-    while True:
-        round_count += 1
-        plan = call_answer_api(history)
-        if plan is None:
-            print("Fail to generate plans, retring")
-            time.sleep(1)
-            continue
-
-        plan_text = format_plan_text(plan)
-        print("\nGenerated Plan")
-        print(plan)
-
-        is_valid, message = run_plan(plan_text, blocks_file, goal_file)
-
-        if is_valid:
-            print("\n✅")
-            print("It takes ", round_count, " round to generate creect answer.")
-            break  
-        else:
-            print("\n❌")
-            print("**Details for error(from Solver):**")
-            print(message)
-
-            explanation = call_explanation_api(message)
-            print("\n**Details for error(from LLM):**")
-            print(explanation)
-
-            history.append({"role": "assistant", "content": plan_text})  
-            history.append({"role": "user", "content": f"Your previous plan had an issue:\n{explanation}\nPlease correct your plan accordingly."})
-            if len(history) > max_history_length:
-                history = history[-max_history_length:]
-
-        time.sleep(1)
+    # Pins the system message and the problem, keeps the latest round and summarizes the rest.
+    conversation = Conversation("You are an expert planner for the Blocks World problem.", initial_prompt, token_budget)
+
+    # repaired: the accepted plan came from PlanRepair, not from the LLM as is.
+    is_valid, plan_text, repaired = False, "", None
+    session_start = time.perf_counter()
+
+    try:
+        while max_rounds is None or round_count < max_rounds:
+            round_count += 1
+            round_start = time.perf_counter()
+            try:
+                # Streaming checks each line as it arrives and cancels at the first invalid action.
+                plan_stream = PlanStream(validator) if stream and samples == 1 else None
+                if plan_stream is not None:
+                    plan = stream_answer_api(conversation.messages(), plan_stream.feed)
+                else:
+                    plan = call_answer_api(conversation.messages(), n=samples)
+            except LLMError as error:
+                emit("round", scenario=blocks_file, round=round_count, error=str(error), llm_seconds=time.perf_counter() - round_start)
+                # Retryable failures were already backed off by the client.
+                if is_fatal(error):
+                    print(f"Fail to generate plan, stopping ({error})")
+                    break
+                print(f"Fail to generate plans, retring ({error})")
+                continue
+            llm_done = time.perf_counter()
+
+            plans = plan if isinstance(plan, list) else [plan]
+            plan_texts = [format_plan_text(plan) for plan in plans]
+            parse_done = time.perf_counter()
+            print("\nGenerated Plan")
+            for plan in plans:
+                print(plan)
+
+            if plan_stream is not None:
+                results = [plan_stream.result(plan_texts[0])]
+            elif len(plan_texts) > 1:
+                results = run_plan_batch(plan_texts, blocks_file, goal_file, stop_on_first_valid=True, executor=executor)
+            else:
+                results = [validator.validate(plan_texts[0])]
+
+            # Accept the first valid candidate, otherwise explain the one that got furthest.
+            best = max(range(len(results)), key=lambda i: (results[i][0], *validator.progress(plan_texts[i])))
+            plan_text = plan_texts[best]
+            is_valid, message = results[best]
+            validate_done = time.perf_counter()
+            repaired = None
+
+            # Try a local repair before spending another LLM round on the feedback.
+            if not is_valid and repair_budget:
+                repaired = repair_plan(validator, parse_plan(plan_text), repair_budget)
+                if repaired is not None:
+                    print("\nRepaired the plan locally:")
+                    plan_text = "\n".join(format_action(action) for action in repaired)
+                    print(plan_text)
+                    is_valid = True
+            repair_done = time.perf_counter()
+
+            # Report every violation at once ("skip" or "force" recovery) instead of the first.
+            if not is_valid and diagnose is not None:
+                report = validator.diagnose(plan_text, diagnose)
+                if report is not None:
+                    message = generate_report_feedback(report, parse_plan(plan_text))
+
+            # The explanation request is reported separately as an "explanation" llm_call.
+            emit("round", scenario=blocks_file, round=round_count, candidates=len(plan_texts), valid=is_valid,
+                 repaired=repaired is not None, llm_seconds=llm_done - round_start, parse_seconds=parse_done - llm_done,
+                 validate_seconds=validate_done - parse_done, repair_seconds=repair_done - validate_done,
+                 diagnose_seconds=time.perf_counter() - repair_done)
+
+            if is_valid:
+                print("\n✅")
+                print("It takes ", round_count, " round to generate creect answer.")
+                if repaired is not None:
+                    print("The last plan was repaired locally.")
+                break  
+            else:
+                print("\n❌")
+                print("**Details for error(from Solver):**")
+                print(message)
+
+                # A failure of a kind already explained reuses that explanation with the
+                # current blocks and skips the explanation request.
+                signature = failure_signature(message)
+                explanation = EXPLANATION_CACHE.get(*signature) if signature is not None else None
+                emit("explanation", scenario=blocks_file, round=round_count, cached=explanation is not None,
+                     signature=signature[0] if signature is not None else None)
+                if explanation is None:
+                    try:
+                        explanation = call_explanation_api(message)
+                        if signature is not None:
+                            EXPLANATION_CACHE.put(*signature, explanation)
+                    except LLMError as error:
+                        # Without an explanation, fall back to the solver feedback itself.
+                        print(f"Fail to generate explanation ({error})")
+                        explanation = message
+                print("\n**Details for error(from LLM):**")
+                print(explanation)
+
+                conversation.add_round(plan_text, explanation, summarize_feedback(message))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        emit("session", scenario=blocks_file, solved=is_valid, rounds=round_count, repaired=is_valid and repaired is not None, seconds=time.perf_counter() - session_start)
+
+    return is_valid, round_count, plan_text, is_valid and repaired is not None
 
 if __name__ == "__main__":
     iterative_planning()
@@ -0,0 +1,112 @@
+import re
+import threading
+from ast import literal_eval
+from collections import OrderedDict
+
+from ActionSchema import ACTIONS
+
+
+FAILURE_PATTERN = re.compile(r"Invalid Action Detected at Step (\d+)\*\*\s*The action `(\(.*?\))`")
+CORE_PATTERN = re.compile(r"UNSAT Core: (\[.*?\])", re.DOTALL)
+NUMBER_PATTERN = re.compile(r"(?<![\w.])\d+(?!\w)")
+# Numbers that are not block or step numbers: list markers and the rules of the prompt.
+LIST_MARKER_PATTERN = re.compile(r"^\s*$")
+RULE_PATTERN = re.compile(r"(?i)rule\s*$")
+
+def failure_signature(feedback):
+
+    # (signature, roles) of the feedback of one invalid action, None for anything else
+    # (goal mismatches, reports of several violations, unknown actions). The signature
+    # is the action, the preconditions violated at the failing step according to the
+    # unsat core and which parameters name the same block, e.g.
+    # (("stack", ("clear",), (0, 1)), {"x": "7", "y": "9", "step": "24"}).
+    failures = FAILURE_PATTERN.findall(feedback)
+    cores = CORE_PATTERN.findall(feedback)
+    if len(failures) != 1 or len(cores) != 1:
+        return None
+    step, action_text = failures[0]
+    try:
+        action, *params = literal_eval(action_text)
+        blocks = tuple(map(int, params))
+    except (ValueError, SyntaxError, TypeError):
+        return None
+    template = ACTIONS.get(action)
+    if template is None or len(blocks) != template.arity:
+        return None
+
+    violated = tuple(condition.kind for condition in template.preconditions
+                     if re.search(re.escape(condition.label(step, condition.blocks(blocks))) + r"(?!\w)", cores[0]))
+    if not violated:
+        return None
+
+    roles = dict(zip(template.params, map(str, blocks)))
+    roles["step"] = step
+    return (action, violated, tuple(blocks.index(block) for block in blocks)), roles
+
+def explanation_template(explanation, roles):
+
+    # The explanation as (text, role) parts, with every block and step number of the
+    # failure replaced by its role. None when a number can not be attributed to exactly
+    # one role, e.g. a block that is not a parameter of the action: the explanation is
+    # then specific to this plan and is not reused.
+    names = {}
+    for role, value in roles.items():
+        if value in names:
+            return None
+        names[value] = role
+
+    parts, last = [], 0
+    for match in NUMBER_PATTERN.finditer(explanation):
+        before = explanation[:match.start()]
+        line = before[before.rfind("\n") + 1:]
+        if explanation.startswith(".", match.end()) and LIST_MARKER_PATTERN.match(line) or RULE_PATTERN.search(line):
+            continue
+        role = names.get(match.group())
+        if role is None:
+            return None
+        parts.append((explanation[last:match.start()], role))
+        last = match.end()
+    parts.append((explanation[last:], None))
+    return tuple(parts)
+
+def instantiate(template, roles):
+    return "".join(text + (roles[role] if role is not None else "") for text, role in template)
+
+class ExplanationCache:
+    # Explanations of earlier failures by failure signature, least recently used first.
+    # Most failed rounds repeat a few classes of mistakes (pick-up of a block that is
+    # not clear, stack onto a covered block, ...), so their explanation is reused with
+    # the blocks of the current failure instead of asking the explanation model again.
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, signature, roles):
+        with self.lock:
+            template = self.entries.get(signature)
+            if template is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(signature)
+            self.hits += 1
+        return instantiate(template, roles)
+
+    def put(self, signature, roles, explanation):
+
+        # Returns whether the explanation could be stored.
+        template = explanation_template(explanation, roles)
+        if template is None or not self.max_entries:
+            return False
+        with self.lock:
+            self.entries[signature] = template
+            self.entries.move_to_end(signature)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return True
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
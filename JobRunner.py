@@ -0,0 +1,168 @@
+import argparse
+import contextlib
+import glob
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+SCRIPTS = {"one": "One_LLM_CEGIS", "double": "Double_LLM_CEGIS"}
+
+def load_manifest(filename):
+
+    # JSON lines with "initial" and "goal" scenario files and optional "id" and "prompt".
+    # Relative paths are resolved against the directory of the manifest.
+    base = os.path.dirname(os.path.abspath(filename))
+    jobs = []
+    with open(filename, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            job = json.loads(line)
+            if "initial" not in job or "goal" not in job:
+                raise ValueError(f"{filename}:{number}: a job needs 'initial' and 'goal'")
+            for key in ("initial", "goal", "prompt"):
+                if job.get(key):
+                    job[key] = os.path.join(base, job[key])
+            job["id"] = str(job.get("id", number))
+            jobs.append(job)
+    return jobs
+
+def manifest_from_directory(directory):
+
+    # The layout written by ScenarioGenerator: <name>_initial.txt, <name>_goal.txt and
+    # optionally <name>_prompt.txt.
+    jobs = []
+    for initial in sorted(glob.glob(os.path.join(directory, "*_initial.txt"))):
+        prefix = initial[:-len("_initial.txt")]
+        prompt = f"{prefix}_prompt.txt"
+        jobs.append({
+            "id": os.path.basename(prefix),
+            "initial": initial,
+            "goal": f"{prefix}_goal.txt",
+            "prompt": prompt if os.path.exists(prompt) else None
+        })
+    return jobs
+
+worker_session = {}
+
+def init_worker(script, slots, url):
+
+    # One CEGIS module per worker process; every client in the pool shares the slots,
+    # so at most max_inflight LLM requests are open across all sessions.
+    module = importlib.import_module(SCRIPTS[script])
+    for client in (getattr(module, "CLIENT", None), getattr(module, "EXP_CLIENT", None)):
+        if client is not None:
+            client.slots = slots
+            if url:
+                client.url = url
+    worker_session["module"] = module
+
+def run_job(job, options, log_dir=None):
+
+    module = worker_session["module"]
+    clients = [client for client in (getattr(module, "CLIENT", None), getattr(module, "EXP_CLIENT", None)) if client is not None]
+    before = [dict(client.usage) for client in clients]
+
+    log = io.StringIO()
+    error = None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            solved, rounds, plan, repaired = module.iterative_planning(job.get("prompt"), job["initial"], job["goal"], **options)
+    except Exception as e:
+        solved, rounds, plan, repaired = False, None, "", False
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+
+    if log_dir is not None:
+        with open(os.path.join(log_dir, f"{job['id']}.log"), "w", encoding="utf-8") as f:
+            f.write(log.getvalue())
+
+    usage = {key: sum(client.usage[key] - used[key] for client, used in zip(clients, before)) for key in before[0]}
+    return {
+        "id": job["id"],
+        "initial": job["initial"],
+        "goal": job["goal"],
+        "solved": solved,
+        "rounds": rounds,
+        "repaired": repaired,
+        "llm_requests": usage["requests"],
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "seconds": round(seconds, 3),
+        "plan": plan,
+        "error": error
+    }
+
+def finished_ids(filename):
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, "r", encoding="utf-8") as f:
+        return {str(json.loads(line)["id"]) for line in f if line.strip()}
+
+def run_jobs(jobs, output, script="one", workers=None, max_inflight=8, url=None, options=None, log_dir=None, resume=False):
+
+    # Runs every job in its own session on a process pool (Z3 contexts are not shared
+    # between threads) and appends one JSON line per job to output as soon as it ends.
+    options = options or {}
+    done = finished_ids(output) if resume else set()
+    pending = [job for job in jobs if job["id"] not in done]
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+
+    results = []
+    start = time.perf_counter()
+    with multiprocessing.Manager() as manager, open(output, "a" if resume else "w", encoding="utf-8") as f:
+        slots = manager.BoundedSemaphore(max_inflight)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(script, slots, url)) as executor:
+            futures = [executor.submit(run_job, job, options, log_dir) for job in pending]
+            for count, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                results.append(result)
+                status = ("solved (repaired)" if result["repaired"] else "solved") if result["solved"] else (result["error"] or "unsolved")
+                print(f"[{count}/{len(pending)}] {result['id']}: {status}, rounds={result['rounds']}, {result['seconds']:.1f}s")
+
+    solved = sum(result["solved"] for result in results)
+    tokens = sum(result["prompt_tokens"] + result["completion_tokens"] for result in results)
+    print(f"Solved {solved}/{len(results)} in {time.perf_counter() - start:.1f}s, {tokens} tokens, results in {output}")
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run many CEGIS sessions concurrently.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="JSON lines with id, initial, goal and optional prompt")
+    source.add_argument("--scenarios", help="directory written by ScenarioGenerator.py")
+    parser.add_argument("--output", default="results.jsonl")
+    parser.add_argument("--script", choices=SCRIPTS, default="one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-inflight", type=int, default=8, help="LLM requests open at the same time")
+    parser.add_argument("--url", help="chat completions endpoint, e.g. a MockLLMServer")
+    parser.add_argument("--max-rounds", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=1)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--repair-budget", type=float, default=0.5)
+    parser.add_argument("--diagnose", choices=("skip", "force"))
+    parser.add_argument("--token-budget", type=int, default=16000, help="conversation size sent per LLM request")
+    parser.add_argument("--log-dir", help="write the output of every session to <log-dir>/<id>.log")
+    parser.add_argument("--resume", action="store_true", help="skip jobs already in the output file")
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest) if args.manifest else manifest_from_directory(args.scenarios)
+    options = {
+        "max_rounds": args.max_rounds,
+        "samples": args.samples,
+        "stream": args.stream,
+        "repair_budget": args.repair_budget,
+        "diagnose": args.diagnose,
+        "token_budget": args.token_budget
+    }
+    run_jobs(jobs, args.output, args.script, args.workers, args.max_inflight, args.url, options, args.log_dir, args.resume)
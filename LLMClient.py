@@ -0,0 +1,245 @@
+import asyncio
+import email.utils
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    pass
+
+class LLMTimeoutError(LLMError):
+    pass
+
+class LLMConnectionError(LLMError):
+    pass
+
+class LLMHTTPError(LLMError):
+    def __init__(self, status_code, body):
+        super().__init__(f"API request failed ({status_code}): {body}")
+        self.status_code = status_code
+        self.body = body
+
+class LLMResponseError(LLMError):
+    pass
+
+class LLMCacheMissError(LLMError):
+    pass
+
+def is_fatal(error):
+    # Errors a later round would only repeat: requests the API rejects (bad key, bad
+    # payload) and misses of a replayed cache.
+    if isinstance(error, LLMHTTPError):
+        return error.status_code not in RETRY_STATUS_CODES
+    return isinstance(error, LLMCacheMissError)
+
+def parse_retry_after(value):
+
+    # Retry-After is either a number of seconds or an HTTP date.
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def completion_contents(response_data):
+
+    choices = response_data.get("choices") if isinstance(response_data, dict) else None
+    if not choices:
+        raise LLMResponseError("Invalid JSON structure")
+    try:
+        return [choice["message"]["content"] for choice in choices]
+    except (KeyError, TypeError):
+        raise LLMResponseError("Invalid JSON structure")
+
+def replay_lines(text, on_line):
+
+    lines = text.split("\n")
+    for k, line in enumerate(lines):
+        if on_line(line) is False:
+            return "\n".join(lines[:k+1])
+    return text
+
+def read_stream(response, on_line):
+
+    # Server-sent events with OpenAI chat.completion.chunk payloads. Returns the text
+    # received, whether the stream ran to the end and the usage chunk if one was sent.
+    received, buffer, usage = [], "", None
+    try:
+        for raw in response.iter_lines():
+            line = raw.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or [{}]
+                buffer += choices[0].get("delta", {}).get("content") or ""
+            except (json.JSONDecodeError, AttributeError, TypeError):
+                raise LLMResponseError("Invalid stream chunk")
+
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                received.append(line)
+                if on_line(line) is False:
+                    return "\n".join(received), False, usage
+        if buffer:
+            received.append(buffer)
+            if on_line(buffer) is False:
+                return "\n".join(received), False, usage
+        return "\n".join(received), True, usage
+    except requests.exceptions.RequestException as e:
+        raise LLMConnectionError(f"Stream interrupted: {e}")
+    finally:
+        response.close()
+
+class LLMClient:
+    # OpenAI-compatible chat completion client. Requests share one pooled HTTP session,
+    # at most max_concurrency of them are in flight, and 429/5xx responses, timeouts
+    # and connection errors are retried with exponential backoff and full jitter.
+    # An optional ResponseCache records or replays responses.
+    def __init__(self, url, api_key, max_concurrency=8, max_retries=5, backoff_base=1.0, backoff_max=30.0, timeout=30, cache=None):
+        self.url = url
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        # Totals over the requests that reached the API (cache hits are not counted).
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.usage_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def add_usage(self, usage):
+        with self.usage_lock:
+            self.usage["requests"] += 1
+            if isinstance(usage, dict):
+                self.usage["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                self.usage["completion_tokens"] += usage.get("completion_tokens") or 0
+
+    def backoff_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def post(self, payload, timeout):
+        with self.slots:
+            return self.session.post(self.url, json=payload, timeout=timeout)
+
+    async def chat_completion(self, payload, timeout=None):
+
+        if self.cache is None or self.cache.mode == "passthrough":
+            return await self.fetch(payload, timeout)
+
+        key = self.cache.key(payload)
+        response_data = self.cache.get(key)
+        if response_data is not None:
+            return response_data
+        if self.cache.mode == "replay":
+            raise LLMCacheMissError(f"No cached response for request {key}")
+
+        response_data = await self.fetch(payload, timeout)
+        self.cache.put(key, response_data)
+        return response_data
+
+    async def fetch(self, payload, timeout=None):
+
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = await asyncio.to_thread(self.post, payload, timeout)
+            except requests.exceptions.Timeout:
+                error = LLMTimeoutError("API request timeout")
+            except requests.exceptions.RequestException as e:
+                error = LLMConnectionError(f"API request failed: {e}")
+            else:
+                if response.status_code == 200:
+                    try:
+                        response_data = response.json()
+                    except (json.JSONDecodeError, ValueError):
+                        raise LLMResponseError("Invalid JSON format")
+                    self.add_usage(response_data.get("usage") if isinstance(response_data, dict) else None)
+                    return response_data
+
+                error = LLMHTTPError(response.status_code, response.text)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            if attempt == self.max_retries:
+                raise error
+            await asyncio.sleep(self.backoff_delay(attempt, retry_after))
+
+    def stream(self, payload, on_line, timeout=None):
+
+        # Streams the first choice and calls on_line for every complete line. Returning
+        # False from on_line cancels the request. Returns the text received until then.
+        # Only failures before the first chunk are retried.
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}, "n": 1}
+        key = None
+        if self.cache is not None and self.cache.mode != "passthrough":
+            key = self.cache.key(payload)
+            response_data = self.cache.get(key)
+            if response_data is not None:
+                return replay_lines(completion_contents(response_data)[0], on_line)
+            if self.cache.mode == "replay":
+                raise LLMCacheMissError(f"No cached response for request {key}")
+
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                with self.slots:
+                    response = self.session.post(self.url, json=payload, timeout=timeout, stream=True)
+                    if response.status_code == 200:
+                        text, complete, usage = read_stream(response, on_line)
+                        self.add_usage(usage)
+                        if complete and key is not None:
+                            self.cache.put(key, {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]})
+                        return text
+                    error = LLMHTTPError(response.status_code, response.text)
+            except requests.exceptions.Timeout:
+                error = LLMTimeoutError("API request timeout")
+            except requests.exceptions.RequestException as e:
+                error = LLMConnectionError(f"API request failed: {e}")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            if attempt == self.max_retries:
+                raise error
+            time.sleep(self.backoff_delay(attempt, retry_after))
+
+    async def chat_completions(self, payloads, timeout=None):
+        return await asyncio.gather(*(self.chat_completion(payload, timeout) for payload in payloads))
+
+    def complete(self, payload, timeout=None):
+        return asyncio.run(self.chat_completion(payload, timeout))
+
+    def close(self):
+        self.session.close()
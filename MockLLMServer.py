@@ -0,0 +1,215 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from DefineState import load_block_positions
+from Planner import generate_plan, perturb_plan, plan_text
+from PromptBuilder import parse_prompt
+
+
+MODES = ("scripted", "perturbed", "search")
+
+def load_script(filename):
+
+    # A JSON list of responses, or plain text with responses separated by "---" lines.
+    with open(filename, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        responses = json.loads(text)
+    except json.JSONDecodeError:
+        responses = [part.strip() for part in text.split("\n---\n")]
+    return [response if isinstance(response, str) else "\n".join(response) for response in responses]
+
+class MockLLMServer(ThreadingHTTPServer):
+    # Offline OpenAI-compatible chat completions endpoint returning Blocks World plans.
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), mode="search", blocks_file="initial.txt", goal_file="goal.txt",
+                 script=None, latency=0.0, jitter=0.0, error_rate=0.0, perturb_rate=0.5, perturb_edits=1, seed=None, line_latency=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+        super().__init__(address, MockLLMHandler)
+        self.mode = mode
+        self.script = list(script or [])
+        self.latency = latency
+        self.jitter = jitter
+        self.line_latency = line_latency
+        self.error_rate = error_rate
+        self.perturb_rate = perturb_rate
+        self.perturb_edits = perturb_edits
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.completions = 0
+        self.errors = 0
+        self.cancelled = 0
+
+        if mode == "scripted" and not self.script:
+            raise ValueError("Scripted mode needs at least one response")
+        self.plans = {}
+        if mode != "scripted":
+            self.plan = generate_plan(load_block_positions(blocks_file), load_block_positions(goal_file))
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def plan_for(self, payload):
+
+        # Prompts rendered by PromptBuilder carry their scenario, so one server can
+        # answer for many scenarios; anything else gets the plan of the server's files.
+        messages = [message for message in payload.get("messages", []) if message.get("role") == "user"]
+        scenario = parse_prompt(str(messages[0].get("content", ""))) if messages else None
+        if scenario is None:
+            return self.plan
+        key = repr(scenario)
+        if key not in self.plans:
+            self.plans[key] = generate_plan(*scenario)
+        return self.plans[key]
+
+    def next_completion(self, payload=None):
+
+        with self.lock:
+            index = self.completions
+            self.completions += 1
+            if self.mode == "scripted":
+                return self.script[index % len(self.script)]
+            actions = self.plan_for(payload or {})
+            if self.mode == "perturbed" and self.rng.random() < self.perturb_rate:
+                actions = perturb_plan(actions, self.rng, self.perturb_edits)
+            return plan_text(actions)
+
+    def draw_failure(self):
+
+        with self.lock:
+            self.requests += 1
+            if self.rng.random() >= self.error_rate:
+                return None
+            self.errors += 1
+            return self.rng.choice((429, 500, 503))
+
+    def delay(self):
+        with self.lock:
+            spread = self.rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency + spread)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, content, usage=None):
+
+        # Server-sent events, one chunk per line with line_latency seconds in between,
+        # like a model generating the plan. Stops when the client disconnects.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        lines = content.split("\n")
+        try:
+            for k, line in enumerate(lines):
+                time.sleep(self.server.line_latency)
+                delta = line + "\n" if k < len(lines) - 1 else line
+                chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            if usage is not None:
+                self.wfile.write(f"data: {json.dumps({'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            with self.server.lock:
+                self.server.cancelled += 1
+
+    def do_POST(self):
+
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except (ValueError, json.JSONDecodeError):
+            self.send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        time.sleep(self.server.delay())
+
+        status = self.server.draw_failure()
+        if status is not None:
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self.send_json(status, {"error": {"message": "Injected failure"}}, headers)
+            return
+
+        n = 1 if payload.get("stream") else payload.get("n", 1)
+        contents = [self.server.next_completion(payload) for _ in range(n)]
+        # Roughly four characters per token.
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in payload.get("messages", [])) // 4
+        completion_tokens = sum(len(content) for content in contents) // 4
+
+        if payload.get("stream"):
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+            self.send_stream(contents[0], usage if (payload.get("stream_options") or {}).get("include_usage") else None)
+            return
+
+        # A complete response takes as long as streaming its longest choice.
+        time.sleep(self.server.line_latency * max(content.count("\n") + 1 for content in contents))
+        self.send_json(200, {
+            "id": f"mock-{self.server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                for i, content in enumerate(contents)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Offline stand-in for the chat completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--mode", choices=MODES, default="search")
+    parser.add_argument("--initial", default="initial.txt")
+    parser.add_argument("--goal", default="goal.txt")
+    parser.add_argument("--script", help="responses for scripted mode (JSON list or '---' separated text)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--line-latency", type=float, default=0.0, help="seconds per streamed plan line")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/5xx")
+    parser.add_argument("--perturb-rate", type=float, default=0.5, help="fraction of perturbed plans in perturbed mode")
+    parser.add_argument("--perturb-edits", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = MockLLMServer((args.host, args.port), args.mode, args.initial, args.goal,
+                           load_script(args.script) if args.script else None, args.latency, args.jitter,
+                           args.error_rate, args.perturb_rate, args.perturb_edits, args.seed, args.line_latency)
+    print(f"Mock LLM server ({args.mode}) listening on {server.url}")
+    server.serve_forever()
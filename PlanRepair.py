@@ -0,0 +1,135 @@
+import time
+from collections import deque
+
+from ConcreteState import simulate_action, compare_concrete_states
+
+
+def legal_actions(state):
+
+    # Physically meaningful moves only: unstack follows the known stacked pairs.
+    blocks = range(1, state.num_blocks + 1)
+    if state.handsfree:
+        for i in blocks:
+            if not state.clear[i]:
+                continue
+            if state.table[i]:
+                yield ("pick-up", str(i))
+        for (i, j), stacked in state.stacked.items():
+            if stacked and state.clear[i] and not state.table[i] and i != j:
+                yield ("unstack", str(i), str(j))
+    else:
+        for i in blocks:
+            if state.hand[i]:
+                yield ("put-down", str(i))
+                for j in blocks:
+                    if j != i and state.clear[j]:
+                        yield ("stack", str(i), str(j))
+
+def state_key(state):
+    stacked = frozenset(pair for pair, value in state.stacked.items() if value)
+    return bytes(state.table), bytes(state.hand), bytes(state.clear), state.handsfree, stacked
+
+def search_patches(state, reached, deadline, max_depth, max_patches=32):
+
+    # Breadth-first search for the shortest action sequences after which reached(state)
+    # holds. Returns every such sequence of the minimal length found before the deadline.
+    if reached(state):
+        return [[]]
+    frontier = deque([(state, [])])
+    visited = {state_key(state)}
+    patches, depth = [], None
+    while frontier and time.perf_counter() < deadline:
+        current, patch = frontier.popleft()
+        if depth is not None and len(patch) >= depth:
+            break
+        if len(patch) >= max_depth:
+            continue
+        for action in legal_actions(current):
+            successor = current.copy()
+            if simulate_action(successor, action, 0):
+                continue
+            key = state_key(successor)
+            if key in visited:
+                continue
+            visited.add(key)
+            if reached(successor):
+                patches.append(patch + [action])
+                depth = len(patch) + 1
+                if len(patches) >= max_patches:
+                    return patches
+            else:
+                frontier.append((successor, patch + [action]))
+    return patches
+
+def valid_run(state, actions):
+
+    # Length of the valid prefix of actions from state, and the state it reaches.
+    state = state.copy()
+    for step, action in enumerate(actions, start=1):
+        if simulate_action(state, action, step) != []:
+            return step - 1, state
+    return len(actions), state
+
+def applicable(action):
+    return lambda state: simulate_action(state.copy(), action, 0) == []
+
+def repair_plan(validator, actions, time_budget=0.5, max_depth=4, max_repairs=3):
+
+    # Splices short action sequences in front of failing steps, so their preconditions
+    # hold again, and appends one if the final state misses the goal. Among patches of
+    # the same length the one that lets the rest of the plan run furthest wins, and a
+    # failing action is dropped if no patch is found. Returns the repaired plan if the
+    # validator accepts it within the time budget, otherwise None.
+    if validator.concrete_initial is None or validator.concrete_goal is None:
+        return None
+    deadline = time.perf_counter() + time_budget
+    goal = validator.concrete_goal
+
+    def goal_distance(state):
+        return len(compare_concrete_states(state, goal))
+
+    state = validator.concrete_initial.copy()
+    repaired, k, repairs = [], 0, 0
+    while k < len(actions):
+        trial = state.copy()
+        violations = simulate_action(trial, actions[k], len(repaired) + 1)
+        if violations is None:
+            return None
+        if not violations:
+            state = trial
+            repaired.append(actions[k])
+            k += 1
+            continue
+
+        repairs += 1
+        if repairs > max_repairs or time.perf_counter() >= deadline:
+            return None
+
+        rest = actions[k:]
+        candidates = [(patch, rest) for patch in search_patches(state, applicable(actions[k]), deadline, max_depth)]
+        candidates.append(([], actions[k+1:]))
+
+        def score(candidate):
+            patch, remaining = candidate
+            patched = state.copy()
+            for action in patch:
+                simulate_action(patched, action, 0)
+            steps, reached = valid_run(patched, remaining)
+            return steps + len(rest) - len(remaining), -goal_distance(reached), -len(patch)
+
+        patch, remaining = max(candidates, key=score)
+        for action in patch:
+            simulate_action(state, action, 0)
+        repaired.extend(patch)
+        actions = actions[:k] + remaining
+
+    if goal_distance(state):
+        patches = search_patches(state, lambda state: goal_distance(state) == 0, deadline, max_depth, max_patches=1)
+        if not patches:
+            return None
+        repaired.extend(patches[0])
+
+    if time.perf_counter() >= deadline:
+        return None
+    is_valid, _ = validator.validate_actions(repaired)
+    return repaired if is_valid else None
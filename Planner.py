@@ -0,0 +1,53 @@
+def format_action(action_tuple):
+    action, *params = action_tuple
+    return f"{action}({','.join(map(str, params))})"
+
+def generate_plan(initial_positions, goal_positions):
+
+    # Tower-by-tower plan: keep the bottom part of each initial tower that already
+    # matches a goal tower, put every other block on the table, then build the goal
+    # towers bottom-up. Always valid, at most 4 actions per block.
+    goal_bottoms = {row[0]: row for row in goal_positions}
+
+    kept = {}
+    actions = []
+    for row in initial_positions:
+        goal_row = goal_bottoms.get(row[0], [])
+        keep = 0
+        while keep < min(len(row), len(goal_row)) and row[keep] == goal_row[keep]:
+            keep += 1
+        kept[row[0]] = keep
+        for m in range(len(row) - 1, max(keep, 1) - 1, -1):
+            actions.append(("unstack", row[m], row[m-1]))
+            actions.append(("put-down", row[m]))
+
+    for row in goal_positions:
+        for m in range(max(kept.get(row[0], 0), 1), len(row)):
+            actions.append(("pick-up", row[m]))
+            actions.append(("stack", row[m], row[m-1]))
+
+    return actions
+
+def perturb_plan(actions, rng, edits=1):
+
+    # Typical LLM mistakes: a dropped action, two swapped actions, a wrong block.
+    actions = list(actions)
+    blocks = sorted({block for _, *params in actions for block in params}) or [1]
+    for _ in range(edits):
+        if not actions:
+            break
+        kind = rng.choice(("drop", "swap", "block"))
+        k = rng.randrange(len(actions))
+        if kind == "drop":
+            del actions[k]
+        elif kind == "swap" and len(actions) > 1:
+            k = min(k, len(actions) - 2)
+            actions[k], actions[k+1] = actions[k+1], actions[k]
+        else:
+            action, *params = actions[k]
+            params[rng.randrange(len(params))] = rng.choice(blocks)
+            actions[k] = (action, *params)
+    return actions
+
+def plan_text(actions):
+    return "\n".join(format_action(action) for action in actions)
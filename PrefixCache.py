@@ -0,0 +1,49 @@
+import hashlib
+from collections import OrderedDict
+
+class PrefixCache:
+    # Concrete states reached by valid plan prefixes, keyed by scenario and a chained
+    # digest of the normalized actions, with LRU eviction.
+    def __init__(self, max_entries=10000, checkpoint_interval=8):
+        self.max_entries = max_entries
+        self.checkpoint_interval = checkpoint_interval
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def prefix_digests(self, actions):
+
+        # One digest per prefix length; stops at the first action that can not be
+        # normalized, since nothing after it can be simulated concretely either.
+        digests = []
+        digest = b""
+        for action, *params in actions:
+            try:
+                normalized = (action, *map(int, params))
+            except ValueError:
+                break
+            digest = hashlib.blake2b(digest + repr(normalized).encode(), digest_size=16).digest()
+            digests.append(digest)
+        return digests
+
+    def longest_prefix(self, scenario_key, digests):
+
+        for length in range(len(digests), 0, -1):
+            key = (scenario_key, digests[length - 1])
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return length, self.entries[key]
+        self.misses += 1
+        return 0, None
+
+    def put(self, scenario_key, digest, state):
+
+        key = (scenario_key, digest)
+        self.entries[key] = state
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,69 @@
+import os
+import re
+from functools import lru_cache
+
+from DefineState import load_block_positions
+
+
+# Same rules, actions and output format as prompt.txt, with the states listed per tower
+# instead of one sentence per block so the prompt stays short on large worlds.
+PROMPT_TEMPLATE = """You are an AI planner for the Blocks World problem. Generate a correct sequence of actions that transforms the initial state into the goal state.
+
+### Rules
+- Only one block can be moved at a time.
+- A block can only be picked up if it is clear (no block is on top of it).
+- A block can only be stacked onto another block if that block is clear.
+- The hand must be empty before picking up another block.
+- Do not include invalid actions.
+
+### Actions
+1. unstack(x,y): pick up x from y; x is clear and the hand is empty.
+2. put-down(x): place x on the table; the hand holds x.
+3. pick-up(x): pick up x from the table; x is clear, on the table and the hand is empty.
+4. stack(x,y): put x on y; the hand holds x and y is clear.
+
+### States
+{num_blocks} blocks. Each line is one tower listed bottom to top, e.g. "1 2 3" means 1 is on the table, 2 is on 1 and 3 is on 2.
+
+Initial state (hand empty):
+{initial}
+
+Goal state:
+{goal}
+
+### Output
+Only output the action sequence, one action per line, no explanations and no code block. For example, from the towers "1 3" and "2" to the tower "1 2 3":
+unstack(3,1)
+put-down(3)
+pick-up(2)
+stack(2,1)
+pick-up(3)
+stack(3,2)
+"""
+
+def describe_towers(block_positions):
+    return "\n".join(" ".join(map(str, row)) for row in block_positions)
+
+def render_prompt(initial_positions, goal_positions, template=PROMPT_TEMPLATE):
+
+    num_blocks = len({block for row in initial_positions for block in row})
+    return template.format(num_blocks=num_blocks, initial=describe_towers(initial_positions), goal=describe_towers(goal_positions))
+
+@lru_cache(maxsize=4096)
+def cached_prompt(blocks_file, blocks_mtime, goal_file, goal_mtime, template):
+    return render_prompt(load_block_positions(blocks_file), load_block_positions(goal_file), template)
+
+def build_prompt(blocks_file="initial.txt", goal_file="goal.txt", template=PROMPT_TEMPLATE):
+
+    # Cached per scenario; editing either file invalidates the entry through its mtime.
+    blocks_file, goal_file = os.path.abspath(blocks_file), os.path.abspath(goal_file)
+    return cached_prompt(blocks_file, os.path.getmtime(blocks_file), goal_file, os.path.getmtime(goal_file), template)
+
+def parse_prompt(prompt):
+
+    # Inverse of render_prompt: the (initial, goal) tower listings, or None for prompts
+    # written by hand.
+    match = re.search(r"Initial state \(hand empty\):\n(.*?)\n\nGoal state:\n(.*?)\n\n", prompt, re.S)
+    if match is None:
+        return None
+    return tuple([list(map(int, line.split())) for line in part.splitlines() if line.strip()] for part in match.groups())
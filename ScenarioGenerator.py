@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+
+from PromptBuilder import render_prompt
+
+
+ADVERSARIAL_KINDS = ("reversal", "interleave", "flatten", "build")
+
+def random_positions(num_blocks, rng=random, split_probability=0.3):
+
+    # Shuffle the blocks and cut the sequence into towers at random gaps.
+    blocks = list(range(1, num_blocks + 1))
+    rng.shuffle(blocks)
+    towers = [[blocks[0]]] if blocks else []
+    for block in blocks[1:]:
+        if rng.random() < split_probability:
+            towers.append([block])
+        else:
+            towers[-1].append(block)
+    return towers
+
+def random_scenario(num_blocks, rng=random, split_probability=0.3):
+    return random_positions(num_blocks, rng, split_probability), random_positions(num_blocks, rng, split_probability)
+
+def adversarial_scenario(kind, num_blocks):
+
+    # Scenarios where every block has to move, like the tower reversal in initial.txt.
+    blocks = list(range(1, num_blocks + 1))
+    if kind == "reversal":
+        return [blocks], [blocks[::-1]]
+    if kind == "interleave":
+        initial = [blocks[0::2], blocks[1::2]]
+        goal = [blocks[1::2][::-1], blocks[0::2][::-1]]
+        return [row for row in initial if row], [row for row in goal if row]
+    if kind == "flatten":
+        return [blocks], [[block] for block in blocks]
+    if kind == "build":
+        return [[block] for block in blocks], [blocks[::-1]]
+    raise ValueError(f"Unknown scenario kind '{kind}', expected one of {ADVERSARIAL_KINDS}")
+
+def write_positions(filename, block_positions):
+    with open(filename, "w") as f:
+        f.write("\n".join(", ".join(map(str, row)) for row in block_positions) + "\n")
+
+def generate_scenarios(directory, count, min_blocks, max_blocks, seed=None, split_probability=0.3, prompts=False):
+
+    # Every pair of tower configurations over the same blocks is reachable, so all
+    # random scenarios are solvable. The same seed always gives the same files.
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    width = len(str(max(count - 1, 0)))
+    scenarios = []
+    for i in range(count):
+        initial_positions, goal_positions = random_scenario(rng.randint(min_blocks, max_blocks), rng, split_probability)
+        prefix = os.path.join(directory, f"scenario_{i:0{width}d}")
+        blocks_file, goal_file = f"{prefix}_initial.txt", f"{prefix}_goal.txt"
+        write_positions(blocks_file, initial_positions)
+        write_positions(goal_file, goal_positions)
+        if prompts:
+            with open(f"{prefix}_prompt.txt", "w", encoding="utf-8") as f:
+                f.write(render_prompt(initial_positions, goal_positions))
+        scenarios.append((blocks_file, goal_file))
+    return scenarios
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate random solvable Blocks World scenarios.")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--min-blocks", type=int, default=5)
+    parser.add_argument("--max-blocks", type=int, default=20)
+    parser.add_argument("--split-probability", type=float, default=0.3, help="chance of starting a new tower after each block")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="scenarios")
+    parser.add_argument("--prompts", action="store_true", help="also write the rendered prompt for each scenario")
+    args = parser.parse_args()
+
+    scenarios = generate_scenarios(args.output_dir, args.count, args.min_blocks, args.max_blocks,
+                                   args.seed, args.split_probability, args.prompts)
+    print(f"Wrote {len(scenarios)} scenarios to {args.output_dir}")
@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+import time
+
+
+# Every event is a dict passed to each registered hook, e.g. a metrics exporter or a
+# JsonLinesHook. With no hooks registered, emit does nothing.
+hooks = []
+
+def add_hook(hook):
+    hooks.append(hook)
+    return hook
+
+def remove_hook(hook):
+    if hook in hooks:
+        hooks.remove(hook)
+
+def enabled():
+    return bool(hooks)
+
+def emit(event, **fields):
+
+    if not hooks:
+        return
+    record = {"event": event, "timestamp": time.time(), "pid": os.getpid(), **fields}
+    for hook in list(hooks):
+        hook(record)
+
+class JsonLinesHook:
+    # Appends one JSON object per event; safe to share between threads and processes
+    # writing to the same file, as each event is a single write.
+    def __init__(self, filename):
+        self.file = open(filename, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class SolverStats:
+    # Counts solver checks and their time for the validation in progress.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checks = 0
+        self.check_seconds = 0.0
+        self.core_size = None
+
+    def check(self, solver, *assumptions):
+        start = time.perf_counter()
+        try:
+            return solver.check(*assumptions)
+        finally:
+            self.checks += 1
+            self.check_seconds += time.perf_counter() - start
@@ -0,0 +1,94 @@
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+from urllib.parse import urlsplit
+
+
+# Thin client of ValidationServer.py. Standard library only: importing it does not load
+# Z3 or the validator.
+VALIDATION_URL = os.environ.get("VALIDATION_URL", "http://127.0.0.1:8100")
+
+class ValidationError(Exception):
+    pass
+
+class ValidationClient:
+    # Keeps one connection open, so a check costs a localhost round trip plus the
+    # validation itself.
+    def __init__(self, url=VALIDATION_URL, timeout=60):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def request(self, method, path, body=None):
+
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        with self.lock:
+            # One retry on a fresh connection when the server closed the kept-alive one.
+            for attempt in range(2):
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                try:
+                    self.connection.request(method, path, data, headers)
+                    response = self.connection.getresponse()
+                    status, raw = response.status, response.read()
+                    break
+                except (ConnectionError, http.client.HTTPException) as e:
+                    self.close()
+                    if attempt:
+                        raise ValidationError(f"Validation server unreachable: {e}")
+                except OSError as e:
+                    self.close()
+                    raise ValidationError(f"Validation server unreachable: {e}")
+
+        try:
+            payload = json.loads(raw)
+        except json.JSONDecodeError:
+            raise ValidationError(f"Invalid response ({status}): {raw[:200]!r}")
+        if status != 200:
+            raise ValidationError(f"Validation request failed ({status}): {payload.get('error', {}).get('message', payload)}")
+        return payload
+
+    def validate(self, scenario, plan_text):
+        # Same (is_valid, feedback) tuple as run_plan.
+        result = self.request("POST", "/validate", {"scenario": scenario, "plan": plan_text})
+        return result["valid"], result["feedback"]
+
+    def add_scenario(self, scenario, blocks_file, goal_file):
+        # Paths are opened by the server, so relative ones are made absolute here.
+        self.request("POST", "/scenarios", {"id": scenario, "initial": os.path.abspath(blocks_file), "goal": os.path.abspath(goal_file)})
+
+    def scenarios(self):
+        return self.request("GET", "/scenarios")["scenarios"]
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check a plan against a running ValidationServer.py.")
+    parser.add_argument("plan", nargs="?", help="plan file, stdin when omitted")
+    parser.add_argument("--scenario", default="default")
+    parser.add_argument("--url", default=VALIDATION_URL)
+    args = parser.parse_args()
+
+    if args.plan:
+        with open(args.plan, "r", encoding="utf-8") as f:
+            plan_text = f.read()
+    else:
+        plan_text = sys.stdin.read()
+
+    is_valid, feedback = ValidationClient(args.url).validate(args.scenario, plan_text)
+    print(feedback)
+    sys.exit(0 if is_valid else 1)
@@ -0,0 +1,155 @@
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from CheckConstrains import PlanValidator
+from JobRunner import load_manifest, manifest_from_directory
+
+
+class ValidationServer(ThreadingHTTPServer):
+    # Long-lived plan validation over localhost HTTP. Z3 stays loaded and every scenario
+    # keeps a warm PlanValidator (parsed states, base solver, prefix cache), so a check
+    # only pays for the plan itself.
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), scenarios=None, engine="concrete", incremental=True, encoding="finite", window=None):
+        super().__init__(address, ValidationHandler)
+        self.options = {"engine": engine, "incremental": incremental, "encoding": encoding, "window": window}
+        self.scenarios = {}
+        self.validators = {}
+        # Requests are accepted concurrently, but all validators share the Z3 context,
+        # which is not thread-safe, so the checks themselves run one at a time.
+        self.z3_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.checks = 0
+        for scenario_id, (blocks_file, goal_file) in (scenarios or {}).items():
+            self.add_scenario(scenario_id, blocks_file, goal_file)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_scenario(self, scenario_id, blocks_file, goal_file):
+        with self.z3_lock:
+            validator = PlanValidator(blocks_file, goal_file, **self.options)
+        with self.lock:
+            self.scenarios[scenario_id] = (blocks_file, goal_file)
+            self.validators[scenario_id] = validator
+
+    def validate(self, scenario_id, plan_text):
+
+        # The run_plan verdict and feedback, with the progress output of the validator
+        # kept out of the server log.
+        validator = self.validators[scenario_id]
+        with self.z3_lock, contextlib.redirect_stdout(io.StringIO()):
+            is_valid, feedback = validator.validate(plan_text)
+        with self.lock:
+            self.checks += 1
+        return is_valid, feedback
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class ValidationHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client can send many checks over one connection. Headers and body
+    # are separate writes, so without TCP_NODELAY every response after the first waits
+    # for the delayed ACK of the client (~40 ms).
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "scenarios": len(self.server.scenarios), "checks": self.server.checks})
+        elif self.path == "/scenarios":
+            self.send_json(200, {"scenarios": {scenario_id: {"initial": blocks_file, "goal": goal_file}
+                                               for scenario_id, (blocks_file, goal_file) in self.server.scenarios.items()}})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except (ValueError, json.JSONDecodeError):
+            self.send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        if self.path == "/scenarios":
+            # {"id", "initial", "goal"}: register (or reload) a scenario at runtime.
+            try:
+                self.server.add_scenario(str(payload["id"]), payload["initial"], payload["goal"])
+            except (KeyError, OSError, ValueError) as e:
+                self.send_json(400, {"error": {"message": f"Can not load scenario: {e}"}})
+                return
+            self.send_json(200, {"id": str(payload["id"])})
+            return
+
+        if self.path != "/validate":
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        # {"scenario", "plan"} -> {"valid", "feedback", "seconds"}
+        scenario_id, plan_text = payload.get("scenario"), payload.get("plan")
+        if not isinstance(plan_text, str):
+            self.send_json(400, {"error": {"message": "'plan' must be the plan text"}})
+            return
+        if scenario_id not in self.server.validators:
+            self.send_json(404, {"error": {"message": f"Unknown scenario '{scenario_id}'"}})
+            return
+
+        start = time.perf_counter()
+        try:
+            is_valid, feedback = self.server.validate(scenario_id, plan_text)
+        except Exception as e:
+            self.send_json(500, {"error": {"message": f"{type(e).__name__}: {e}"}})
+            return
+        self.send_json(200, {"valid": is_valid, "feedback": feedback, "seconds": time.perf_counter() - start})
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Plan validation service with warm Z3 and preloaded scenarios.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--manifest", help="JSON lines with id, initial and goal, as for JobRunner.py")
+    source.add_argument("--scenarios", help="directory written by ScenarioGenerator.py")
+    parser.add_argument("--initial", default="initial.txt", help="scenario 'default' without --manifest or --scenarios")
+    parser.add_argument("--goal", default="goal.txt")
+    parser.add_argument("--engine", choices=("concrete", "z3"), default="concrete")
+    # Same verdicts as the function encoding, with failing plans an order of magnitude faster.
+    parser.add_argument("--encoding", choices=("function", "finite"), default="finite")
+    parser.add_argument("--window", type=int, help="steps per solver for long plans")
+    args = parser.parse_args()
+
+    if args.manifest or args.scenarios:
+        jobs = load_manifest(args.manifest) if args.manifest else manifest_from_directory(args.scenarios)
+        scenarios = {job["id"]: (job["initial"], job["goal"]) for job in jobs}
+    else:
+        scenarios = {"default": (args.initial, args.goal)}
+
+    start = time.perf_counter()
+    server = ValidationServer((args.host, args.port), scenarios, args.engine, True, args.encoding, args.window)
+    print(f"Loaded {len(scenarios)} scenario(s) in {time.perf_counter() - start:.1f}s")
+    print(f"Validation server listening on {server.url}")
+    server.serve_forever()